@@ -1,6 +1,21 @@
-from flask import Flask, request, session, jsonify, render_template, redirect, flash, url_for
+import html
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import click
+
+from flask import (Flask, Response, request, session, jsonify, render_template, redirect, flash, url_for,
+                   stream_with_context)
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from flask_migrate import Migrate, upgrade
+from sqlalchemy.exc import IntegrityError
+
+from events import StreamLimiter, make_broker, parse_hub_url, run_hub
+from metrics import init_instrumentation
+from storage import configure_storage, database_uri, write_transaction
 
 
 # Initializing the Flask application
@@ -8,11 +23,30 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = 'I_dont_really_care_if_this_is_secure' # adding a secret key
 
 # Configuring the database URI for SQLAlchemy
-# Using SQLite for simplicity, creating a file 'site.db' in the project directory
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
+# Using SQLite for simplicity, creating a file 'site.db' in the project directory,
+# unless the DATABASE_URL environment variable points at another database
+app.config['SQLALCHEMY_DATABASE_URI'] = database_uri()
+app.config['MAX_PAGE_SIZE'] = 500  # Largest ?limit= accepted by the paginated read endpoints
+app.config['MAX_BATCH_SIZE'] = 1000  # Most operations accepted by a single /batch request
+app.config['IMPORT_CHUNK_SIZE'] = 20000  # NDJSON lines committed per /import transaction
+app.config['MAX_SEARCH_RESULTS'] = 100  # Largest ?limit= accepted by /search
+app.config['RESPONSE_CACHE_SIZE'] = 256  # Serialized read responses kept in each worker's LRU cache
+# None delivers change events within each process; 'hub://host:port' relays them between worker
+# processes through the hub started with `flask event-hub`
+app.config['EVENT_BROKER_URL'] = None
+# Shared secret of the hub and its workers, read from the environment; the hub refuses to run without it
+app.config['EVENT_HUB_AUTHKEY'] = os.environ.get('EVENT_HUB_AUTHKEY')
+app.config['EVENT_BUFFER_SIZE'] = 100  # Recent change events kept per user for Last-Event-ID replay
+app.config['EVENT_MAX_ROWS'] = 200  # Larger changes are announced without rows; clients fetch them from /changes
+app.config['EVENT_HEARTBEAT_SECONDS'] = 15  # Idle time after which /events sends a heartbeat comment
+app.config['MAX_EVENT_STREAMS_PER_USER'] = 5  # Open /events connections allowed per user
+app.config['METRICS_SAMPLE_RATE'] = 0.1  # Share of requests whose SQL statements, DB time and rows are recorded
+app.config['METRICS_N_PLUS_ONE_THRESHOLD'] = 10  # Executions of one statement in a request that get it flagged as N+1
 
 db = SQLAlchemy(app)  # Initializing the database with the app configuration
-migrate = Migrate(app, db)
+migrate = Migrate(app, db, render_as_batch=True)  # Batch mode lets migrations alter SQLite tables
+configure_storage(app, db)  # WAL mode, pragmas and queued writers for SQLite
+metrics = init_instrumentation(app, db)  # Request and SQL metrics, served at /metrics
 
 
 # User Model
@@ -21,26 +55,463 @@ class User(db.Model):
     username = db.Column(db.String(50), unique=True, nullable=False)  # Username, must be unique and not null
     password = db.Column(db.String(60), nullable=False)  # Password, hashed, not null
     lists = db.relationship('TodoList', backref='user', lazy=True)  # Relationship with TodoList, one user to many lists
+    # Bumped by every write to the user's lists or items; read endpoints use it as their ETag and cache key
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
 
 # TodoList Model
 class TodoList(db.Model):
     id = db.Column(db.Integer, primary_key=True)  # Primary key, unique identifier for each list
     title = db.Column(db.String(100), nullable=False)  # Title of the todo list, not null
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))  # Foreign key referencing User model
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)  # Foreign key referencing User model
     items = db.relationship('TodoItem', backref='list', lazy=True)  # Relationship with TodoItem, one list to many items
+    # Owner's data_version when the list was last created or changed, used by /changes
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+    # Progress counters, kept up to date by every write to the list's items (see CountChanges)
+    item_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Items at any depth
+    completed_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Completed ones
+    open_count = db.column_property(item_count - completed_count)
 
 
 # TodoItem Model
 class TodoItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)  # Primary key, unique identifier for each item
     content = db.Column(db.String(200), nullable=False)  # Content of the todo item, not null
-    list_id = db.Column(db.Integer, db.ForeignKey('todo_list.id'), nullable=False)  # Foreign key referencing TodoList model 
+    list_id = db.Column(db.Integer, db.ForeignKey('todo_list.id'), nullable=False, index=True)  # Foreign key referencing TodoList model 
     # Self-referencing foreign key to implement hierarchical todo items (sub-items)
-    parent_id = db.Column(db.Integer, db.ForeignKey('todo_item.id'), nullable=True)  
+    parent_id = db.Column(db.Integer, db.ForeignKey('todo_item.id'), nullable=True, index=True)  
     # Relationship for handling sub-items. Each item can have multiple sub-items.
     sub_items = db.relationship('TodoItem', backref=db.backref('parent', remote_side=[id]), lazy=True)  
     completed = db.Column(db.Boolean, default=False)  # Boolean to track whether a todo item is completed or not
+    # Materialized path of ancestor IDs ending with the item's own ID, e.g. '/1/5/9/'.
+    # Every item in a subtree shares its root's path as a prefix, so subtree operations are a single range query.
+    # Compared byte by byte on PostgreSQL too, where the default collation may ignore '/' (see subtree_filter)
+    path = db.Column(db.Text().with_variant(db.Text(collation='C'), 'postgresql'), index=True)
+    depth = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # 0 for top-level items
+    # Owner's data_version when the item was last created or changed, used by /changes
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+    # Progress counters of the item's subtree, not counting the item itself (see CountChanges)
+    descendant_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    completed_descendant_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    open_descendant_count = db.column_property(descendant_count - completed_descendant_count)
+
+
+# Tombstone Model
+class Tombstone(db.Model):
+    id = db.Column(db.Integer, primary_key=True)  # Primary key, unique identifier for each tombstone
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # User who owned the deleted row
+    kind = db.Column(db.String(10), nullable=False)  # 'list' or 'item'
+    object_id = db.Column(db.Integer, nullable=False)  # ID of the deleted list or item
+    change_seq = db.Column(db.Integer, nullable=False)  # Owner's data_version when the row was deleted
+    __table_args__ = (db.Index('ix_tombstone_user_id_change_seq', 'user_id', 'change_seq'),)
+
+
+# ImportJob Model
+class ImportJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)  # Primary key, unique identifier for each import
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # User the lists are imported for
+    status = db.Column(db.String(10), nullable=False, default='running')  # 'running', 'failed' or 'done'
+    lines_done = db.Column(db.Integer, nullable=False, default=0)  # Input lines committed so far; a resume skips them
+    lists_imported = db.Column(db.Integer, nullable=False, default=0)
+    items_imported = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)  # Why the last chunk failed
+
+
+# ImportIdMap Model
+class ImportIdMap(db.Model):
+    # IDs of the rows an import created, by the IDs they had in the imported file,
+    # so chunks (and resumed imports) can resolve references to earlier chunks; deleted once the import is done
+    job_id = db.Column(db.Integer, db.ForeignKey('import_job.id'), primary_key=True)
+    kind = db.Column(db.String(10), primary_key=True)  # 'list' or 'item'
+    source_id = db.Column(db.String(64), primary_key=True)  # ID in the imported file
+    target_id = db.Column(db.Integer, nullable=False)  # ID of the created list or item
+
+
+def subtree_filter(path):
+    """
+    Build a filter matching an item and all of its descendants.
+    Paths only contain digits and '/', and '0' sorts right after '/', so the
+    prefix match is written as a range that can use the index on path. This
+    relies on paths comparing byte by byte, as SQLite's default collation
+    does; on PostgreSQL the column is declared with the "C" collation.
+    :param path: Materialized path of the subtree's root item.
+    """
+    return db.and_(TodoItem.path >= path, TodoItem.path < path[:-1] + '0')
+
+
+def ancestor_ids(path):
+    """
+    Return the IDs of an item's ancestors, root first, parsed from its path.
+    :param path: Materialized path of the item.
+    """
+    return [int(part) for part in path.strip('/').split('/')[:-1]]
+
+
+class CountChanges:
+    """
+    Collects how a write changes the progress counters of lists and items, and
+    writes the changes with one UPDATE per table and distinct amount, inside the
+    write's transaction. Counters are only ever adjusted by the rows a write
+    touches, never recounted, so reading them costs nothing however big the
+    tree is; `flask recount-progress` repairs them if they ever drift.
+    """
+
+    def __init__(self):
+        self.lists = {}  # List ID -> [change of item_count, change of completed_count, change_seq]
+        self.items = {}  # Item ID -> [change of descendant_count, change of completed_descendant_count, change_seq]
+
+    def add(self, list_id, item_ids, total, completed, seq):
+        """
+        Record items being added to a list and to the subtrees of some items,
+        or removed from them with negative counts.
+        :param list_id: ID of the list the items are in.
+        :param item_ids: IDs of the items they are descendants of, usually ancestor_ids() of their path.
+        :param total: Number of items added.
+        :param completed: Number of completed items added.
+        :param seq: Change sequence to stamp the changed lists and items with.
+        """
+        for counts, object_id in [(self.lists, list_id)] + [(self.items, item_id) for item_id in item_ids]:
+            change = counts.setdefault(object_id, [0, 0, seq])
+            change[0] += total
+            change[1] += completed
+            change[2] = seq
+
+    def add_new_items(self, rows, seq):
+        """
+        Record bulk inserted items.
+        :param rows: Item rows with list_id, path and completed, as passed to an INSERT.
+        """
+        for row in rows:
+            self.add(row['list_id'], ancestor_ids(row['path']), 1, int(bool(row['completed'])), seq)
+
+    def fill_new_rows(self, list_rows, item_rows):
+        """
+        Set the counters of lists and items that are about to be bulk inserted
+        in their rows, rather than updating them after the INSERT.
+        """
+        for rows, counts, keys in ((list_rows, self.lists, ('item_count', 'completed_count')),
+                                   (item_rows, self.items, ('descendant_count', 'completed_descendant_count'))):
+            for row in rows:
+                total, completed, _ = counts.pop(row['id'], (0, 0, None))
+                row[keys[0]], row[keys[1]] = total, completed
+
+    def apply(self):
+        """
+        Write the recorded changes, grouping the lists and items changed by the
+        same amounts into one UPDATE. Changes that cancel out are skipped.
+        """
+        for model, counts, total_column, completed_column in (
+                (TodoList, self.lists, TodoList.item_count, TodoList.completed_count),
+                (TodoItem, self.items, TodoItem.descendant_count, TodoItem.completed_descendant_count)):
+            groups = {}
+            for object_id, (total, completed, seq) in counts.items():
+                if total or completed:
+                    groups.setdefault((total, completed, seq), []).append(object_id)
+            for (total, completed, seq), object_ids in groups.items():
+                for start in range(0, len(object_ids), 500):  # Staying under SQLite's limit of bound parameters
+                    db.session.execute(
+                        db.update(model).where(model.id.in_(object_ids[start:start + 500]))
+                        .values({total_column: total_column + total, completed_column: completed_column + completed,
+                                 model.change_seq: seq}),
+                        execution_options={'synchronize_session': 'fetch'},
+                    )
+            counts.clear()
+
+
+def adjust_counts(list_id, item_ids, total, completed, seq):
+    """
+    Change the progress counters of a list and of some of its items right away.
+    See CountChanges.add() for the parameters.
+    """
+    changes = CountChanges()
+    changes.add(list_id, item_ids, total, completed, seq)
+    changes.apply()
+
+
+def create_item(content, list_id, parent=None, completed=False):
+    """
+    Create a todo item and give it its materialized path.
+    Sub-items always live in their parent's list.
+    :param content: Content of the new item.
+    :param list_id: ID of the list for a top-level item.
+    :param parent: Parent TodoItem, or None for a top-level item.
+    :param completed: Whether the item starts out completed.
+    """
+    if parent:
+        list_id = parent.list_id
+
+    new_item = TodoItem(content=content, list_id=list_id, parent_id=parent.id if parent else None,
+                        completed=completed, depth=parent.depth + 1 if parent else 0,
+                        change_seq=bump_list_owner_version(list_id))
+    db.session.add(new_item)
+    db.session.flush()  # Flushing to get the ID the path is built from
+    new_item.path = (parent.path if parent else '/') + f'{new_item.id}/'
+    adjust_counts(list_id, ancestor_ids(new_item.path), 1, int(bool(completed)), new_item.change_seq)
+    return new_item
+
+
+def allocate_ids(model, count):
+    """
+    Reserve IDs for lists or items that are about to be bulk inserted, so
+    references to them (like item paths) can be built before the INSERT.
+    On PostgreSQL they are drawn from the ID column's sequence, so later
+    inserts that let the database pick the ID don't collide with them.
+    Elsewhere they follow the highest ID in use, which SQLite and MySQL move
+    their next automatic ID past; this must be called inside the transaction
+    that inserts them, and a concurrent insert that takes one of the IDs
+    first makes the INSERT fail on the primary key rather than produce a
+    wrong tree.
+    :param model: TodoList, TodoItem or User.
+    :param count: Number of IDs needed.
+    """
+    bind = db.session.get_bind()
+    if bind.dialect.name == 'postgresql':
+        sequence = db.func.pg_get_serial_sequence(bind.dialect.identifier_preparer.format_table(model.__table__), 'id')
+        return db.session.execute(db.select(db.func.nextval(sequence))
+                                  .select_from(db.func.generate_series(1, count))).scalars().all()
+
+    first_id = (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+    return range(first_id, first_id + count)
+
+
+def move_subtree(todo_item, new_list_id, new_parent=None):
+    """
+    Move an item and all of its descendants with a single UPDATE statement.
+    :param todo_item: Root of the subtree being moved.
+    :param new_list_id: ID of the destination list (ignored when new_parent is given).
+    :param new_parent: New parent TodoItem, or None to make the item top-level.
+    """
+    if new_parent:
+        new_list_id = new_parent.list_id
+
+    old_path = todo_item.path
+    new_path = (new_parent.path if new_parent else '/') + f'{todo_item.id}/'
+    depth_change = (new_parent.depth + 1 if new_parent else 0) - todo_item.depth
+
+    old_list_id = todo_item.list_id
+    old_owner_id = list_owner_id(old_list_id)
+    new_owner_id = list_owner_id(new_list_id)
+    if old_owner_id != new_owner_id:  # The items disappear from the old owner's lists
+        bury_items(old_owner_id, subtree_filter(old_path))
+
+    # Taking the subtree's items out of the old list's and ancestors' counters and adding them to the new
+    # ones; the ancestors the item keeps (and its list, when it stays in it) see no change and aren't updated
+    total = 1 + todo_item.descendant_count
+    completed = int(bool(todo_item.completed)) + todo_item.completed_descendant_count
+    changes = CountChanges()
+    changes.add(old_list_id, ancestor_ids(old_path), -total, -completed, bump_data_version(old_owner_id))
+    changes.add(new_list_id, ancestor_ids(new_path), total, completed, bump_data_version(new_owner_id))
+
+    db.session.execute(
+        db.update(TodoItem)
+        .where(subtree_filter(old_path))
+        .values(
+            path=db.literal(new_path).concat(db.func.substr(TodoItem.path, len(old_path) + 1)),
+            depth=TodoItem.depth + depth_change,
+            list_id=new_list_id,
+            parent_id=db.case((TodoItem.id == todo_item.id, new_parent.id if new_parent else None),
+                              else_=TodoItem.parent_id),
+            change_seq=bump_data_version(new_owner_id),
+        ),
+        execution_options={'synchronize_session': 'fetch'},
+    )
+    changes.apply()
+
+
+def delete_subtree(todo_item):
+    """
+    Delete an item and all of its descendants with a single DELETE statement,
+    leaving tombstones for them.
+    :param todo_item: Root of the subtree being deleted.
+    """
+    list_id, path = todo_item.list_id, todo_item.path
+    total = 1 + todo_item.descendant_count
+    completed = int(bool(todo_item.completed)) + todo_item.completed_descendant_count
+
+    bury_items(list_owner_id(list_id), subtree_filter(path))
+    db.session.execute(
+        db.delete(TodoItem).where(subtree_filter(path)),
+        execution_options={'synchronize_session': 'fetch'},
+    )
+    adjust_counts(list_id, ancestor_ids(path), -total, -completed, bump_list_owner_version(list_id))
+
+
+def complete_subtree(todo_item):
+    """
+    Mark an item and all of its descendants as complete with a single UPDATE statement.
+    :param todo_item: Root of the subtree being completed.
+    """
+    list_id, path = todo_item.list_id, todo_item.path
+    seq = bump_list_owner_version(list_id)
+    newly_completed = (db.session.query(db.func.count(TodoItem.id))
+                       .filter(subtree_filter(path), TodoItem.completed.isnot(True))
+                       .scalar())
+
+    # Every descendant of every item in the subtree is complete now
+    db.session.execute(
+        db.update(TodoItem).where(subtree_filter(path))
+        .values(completed=True, completed_descendant_count=TodoItem.descendant_count, change_seq=seq),
+        execution_options={'synchronize_session': 'fetch'},
+    )
+    adjust_counts(list_id, ancestor_ids(path), 0, newly_completed, seq)
+
+
+def get_ancestors(todo_item):
+    """
+    Load an item's ancestors, root first, with a single SELECT statement.
+    :param todo_item: Item whose ancestors should be loaded.
+    """
+    return TodoItem.query.filter(TodoItem.id.in_(ancestor_ids(todo_item.path))).order_by(TodoItem.depth).all()
+
+
+def bump_data_version(user_id):
+    """
+    Increase a user's data version as part of the current transaction and
+    return the new version. It doubles as the change sequence that rows
+    written in the transaction are stamped with, and only goes up once per
+    transaction, however many writes it makes.
+    :param user_id: ID of the user whose lists or items are being changed.
+    """
+    if user_id is None:
+        return 0
+
+    bumped = db.session.info.setdefault('bumped_versions', {})
+    if user_id not in bumped:
+        db.session.execute(
+            db.update(User).where(User.id == user_id).values(data_version=User.data_version + 1),
+            execution_options={'synchronize_session': False},
+        )
+        bumped[user_id] = data_version(user_id)
+    return bumped[user_id]
+
+
+@db.event.listens_for(db.session, 'after_commit')
+@db.event.listens_for(db.session, 'after_rollback')
+def reset_bumped_versions(session):
+    session.info.pop('bumped_versions', None)  # The next transaction bumps versions again
+
+
+@db.event.listens_for(db.session, 'before_commit')
+def collect_change_events(session):
+    """
+    Build a change event for every user whose data the committing transaction
+    changed. This runs while the transaction can still be queried, so each
+    event holds exactly the rows stamped with the user's new version.
+    """
+    events = []
+    bulk = session.info.pop('bulk_changes', False)  # Set by bulk writers, like imports
+    for user_id, seq in session.info.get('bumped_versions', {}).items():
+        if bulk:
+            changes = {'seq': seq, 'resync': True}  # Not even loading rows that are known to be too many
+        else:
+            # Loading at most one row of each kind over the maximum, which is enough to tell it's exceeded,
+            # rather than building every row of a big change only to drop them
+            changes = load_changes(user_id, seq - 1, until=seq, limit=app.config['EVENT_MAX_ROWS'] + 1)
+            rows = len(changes['lists']) + len(changes['items']) + sum(map(len, changes['deleted'].values()))
+            if rows > app.config['EVENT_MAX_ROWS']:
+                changes = {'seq': seq, 'resync': True}  # Keeping events small, clients fetch big changes from /changes
+        events.append((user_id, seq, changes))
+    session.info['change_events'] = events
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def publish_change_events(session):
+    for user_id, seq, changes in session.info.pop('change_events', []):
+        get_broker().publish(user_id, seq, changes)
+
+
+@db.event.listens_for(db.session, 'after_rollback')
+def discard_change_events(session):
+    session.info.pop('change_events', None)
+    session.info.pop('bulk_changes', None)
+
+
+def get_broker():
+    """
+    Return the process's change event broker, creating it on first use so that
+    CLI commands don't connect to the event hub.
+    """
+    with broker_lock:
+        if 'event_broker' not in app.extensions:
+            app.extensions['event_broker'] = make_broker(app.config['EVENT_BROKER_URL'],
+                                                         (app.config['EVENT_HUB_AUTHKEY'] or '').encode(),
+                                                         app.config['EVENT_BUFFER_SIZE'])
+        return app.extensions['event_broker']
+
+
+broker_lock = threading.Lock()
+
+
+def list_owner_id(list_id):
+    """
+    Return the ID of the user who owns a todo list.
+    :param list_id: ID of the list.
+    """
+    return db.session.query(TodoList.user_id).filter_by(id=list_id).scalar()
+
+
+def bump_list_owner_version(list_id):
+    """
+    Increase the data version of the user who owns a todo list and return it.
+    :param list_id: ID of the list being changed.
+    """
+    return bump_data_version(list_owner_id(list_id))
+
+
+def bury_items(user_id, condition):
+    """
+    Leave tombstones for every item matching a filter with one INSERT ... SELECT,
+    before those items are deleted or moved out of the user's lists.
+    :param user_id: ID of the user the items are disappearing for.
+    :param condition: Filter selecting the items.
+    """
+    if user_id is None:
+        return
+
+    db.session.execute(db.insert(Tombstone).from_select(
+        ['user_id', 'kind', 'object_id', 'change_seq'],
+        db.select(db.literal(user_id), db.literal('item'), TodoItem.id, db.literal(bump_data_version(user_id)))
+        .where(condition),
+    ))
+
+
+def data_version(user_id):
+    """
+    Return a user's current data version.
+    :param user_id: ID of the user.
+    """
+    return db.session.query(User.data_version).filter_by(id=user_id).scalar() or 0
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache of serialized read responses. Keys include the
+    user's data version, so entries never go stale; writes just make them
+    unreachable and they age out once the cache is full.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)  # Marking the entry as most recently used
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)  # Evicting the least recently used entry
+
+
+response_cache = ResponseCache(app.config['RESPONSE_CACHE_SIZE'])
+event_streams = StreamLimiter(app.config['MAX_EVENT_STREAMS_PER_USER'])
 
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -97,10 +568,11 @@ def create_todolist():
     title = data.get('title')  # Extracting the title of the todo list from the data
     # user_id = data.get('user_id')  # Extracting the user_id from the data
     user_id = session['user_id']
-    print(user_id)
+    app.logger.debug('Creating a todo list for user %s', user_id)
 
     # Creating a new TodoList object with the provided title and user_id
     new_list = TodoList(title=title, user_id=user_id)
+    new_list.change_seq = bump_data_version(user_id)
     db.session.add(new_list)  # Adding the new todo list to the database session
     db.session.commit()  # Committing the session to save the todo list in the database
 
@@ -115,6 +587,7 @@ def update_todo_list(list_id):
     todo_list = TodoList.query.get(list_id)
     if todo_list:
         todo_list.title = title
+        todo_list.change_seq = bump_data_version(todo_list.user_id)
         db.session.commit()
         return jsonify({"message": "Todo list updated successfully."}), 200
     else:
@@ -127,8 +600,13 @@ def update_todoitem(item_id):
     todo_item = TodoItem.query.get(item_id)
     
     if todo_item:
+        was_completed = bool(todo_item.completed)
         todo_item.content = data.get('content', todo_item.content)
         todo_item.completed = data.get('completed', todo_item.completed)
+        todo_item.change_seq = bump_list_owner_version(todo_item.list_id)
+        if bool(todo_item.completed) != was_completed:
+            adjust_counts(todo_item.list_id, ancestor_ids(todo_item.path), 0, 1 if todo_item.completed else -1,
+                          todo_item.change_seq)
         db.session.commit()
         return jsonify({"message": "Todo item updated successfully."}), 200
     else:
@@ -143,8 +621,7 @@ def create_todoitem():
     list_id = data.get('list_id')  # Extracting the list_id from the data
 
     # Creating a new TodoItem object with the provided content and list_id
-    new_item = TodoItem(content=content, list_id=list_id)
-    db.session.add(new_item)  # Adding the new todo item to the database session
+    create_item(content, list_id)
     db.session.commit()  # Committing the session to save the todo item in the database
 
     return jsonify({"message": "Todo item added successfully."}), 201  # Returning a success message
@@ -155,7 +632,7 @@ def complete_todoitem(item_id):
     todo_item = TodoItem.query.get(item_id)  # Querying the database to find the todo item by its ID
 
     if todo_item:  # Checking if the todo item exists
-        todo_item.completed = True  # Marking the todo item as complete
+        complete_subtree(todo_item)  # Marking the todo item and all of its sub-items as complete
         db.session.commit()  # Committing the changes to the database
         return jsonify({"message": f"Todo item {item_id} marked as complete."}), 200  # Returning a success message
     else:
@@ -186,6 +663,13 @@ def mark_as_complete(item_id):
 def delete_todo_list(list_id):
     todo_list = TodoList.query.get(list_id)
     if todo_list:
+        # Deleting the list's items in one statement so none are left pointing at a missing list
+        bury_items(todo_list.user_id, TodoItem.list_id == list_id)
+        db.session.execute(db.delete(TodoItem).where(TodoItem.list_id == list_id),
+                           execution_options={'synchronize_session': 'fetch'})
+        if todo_list.user_id is not None:
+            db.session.add(Tombstone(user_id=todo_list.user_id, kind='list', object_id=list_id,
+                                     change_seq=bump_data_version(todo_list.user_id)))
         db.session.delete(todo_list)
         db.session.commit()
         return jsonify({"message": "Todo list deleted successfully."}), 200
@@ -197,7 +681,7 @@ def delete_todo_list(list_id):
 @app.route('/delete-todo-item/<int:item_id>', methods=['DELETE'])
 def delete_todoitem(item_id):
     """
-    Delete a todo item by its ID.
+    Delete a todo item and all of its sub-items by its ID.
     :param item_id: ID of the todo item to be deleted.
     """
 
@@ -205,7 +689,7 @@ def delete_todoitem(item_id):
     todo_item = TodoItem.query.get(item_id)
 
     if todo_item:  # Checking if the todo item exists
-        db.session.delete(todo_item)  # Deleting the todo item from the database session
+        delete_subtree(todo_item)  # Deleting the todo item and its sub-items so no descendants are orphaned
         db.session.commit()  # Committing the changes to the database
 
         return jsonify({"message": f"Todo item {item_id} deleted successfully."}), 200  # Returning a success message
@@ -216,8 +700,7 @@ def delete_todoitem(item_id):
 
 @app.route('/add-todo-list', methods=['POST'])
 def add_todo_list():
-    print("This workssssss")
-    
+    app.logger.debug('add_todo_list called')
     return jsonify({"message": "Todo list added successfully."}), 201
 
 
@@ -228,94 +711,1268 @@ def add_todo_item():
     list_id = data.get('list_id')
     parent_id = data.get('parent_id', None)
 
-    new_item = TodoItem(content=content, list_id=list_id, parent_id=parent_id)
-    db.session.add(new_item)
+    parent = None
+    if parent_id:
+        parent = TodoItem.query.get(parent_id)
+        if not parent:
+            return jsonify({"message": "Parent item not found."}), 404
+
+    create_item(content, list_id, parent)
     db.session.commit()
 
     return jsonify({"message": "Todo item added successfully."}), 201
 
 
+def current_user_id():
+    """
+    Return the ID of the logged-in user, or None if nobody is logged in.
+    """
+    return session.get('user_id')
+
+
+def page_args():
+    """
+    Read the keyset pagination arguments from the query string.
+    ?after_list= and ?after= are the list ID and ID of the last item on the
+    previous page, and ?limit= the page size. Without a limit everything is
+    one page, so the other two are only read along with it.
+    """
+    limit = request.args.get('limit', type=int)
+    if limit is None:
+        return 0, 0, None
+    limit = max(1, min(limit, app.config['MAX_PAGE_SIZE']))
+    return request.args.get('after_list', 0, type=int), request.args.get('after', 0, type=int), limit
+
+
+def page_items_query(user_id, after_list, after, last, *columns):
+    """
+    Build a query for the given columns of a user's items that come after
+    (after_list, after) in (list ID, item ID) order, up to and including last.
+    :param user_id: ID of the user who owns the items.
+    :param after_list: List ID of the last item on the previous page, or 0.
+    :param after: ID of the last item on the previous page, or 0.
+    :param last: (list ID, item ID) of the page's last item, or None if the page runs to the end.
+    """
+    query = (db.session.query(*columns)
+             .join(TodoList, TodoItem.list_id == TodoList.id)
+             .filter(TodoList.user_id == user_id,
+                     db.tuple_(TodoItem.list_id, TodoItem.id) > db.tuple_(after_list, after)))
+    if last is not None:
+        query = query.filter(db.tuple_(TodoItem.list_id, TodoItem.id) <= db.tuple_(*last))
+    return query
+
+
+def last_of_page(user_id, after_list, after, limit, top_level=False):
+    """
+    Find the (list ID, item ID) of the last item on a page of limit items,
+    or None when no more than limit are left and the page runs to the end.
+    :param top_level: Count only top-level items, which bring their sub-items along.
+    """
+    if limit is None:
+        return None
+    query = page_items_query(user_id, after_list, after, None, TodoItem.list_id, TodoItem.id)
+    if top_level:
+        query = query.filter(TodoItem.parent_id.is_(None))
+    # Reading one item past the page tells whether another page follows
+    rows = query.order_by(TodoItem.list_id, TodoItem.id).offset(limit - 1).limit(2).all()
+    return tuple(rows[0]) if len(rows) == 2 else None
+
+
+def lists_of_page(user_id, after_list, last):
+    """
+    Load the lists a page of items spans, ordered by ID: from the list the
+    previous page ended in to the list of the page's last item. Lists
+    without items are sent on the page their ID falls in.
+    """
+    query = TodoList.query.filter(TodoList.user_id == user_id, TodoList.id >= after_list)
+    if last is not None:
+        query = query.filter(TodoList.id <= last[0])
+    return query.order_by(TodoList.id).all()
+
+
+def paginated_response(data, last, limit):
+    """
+    Turn a page into a JSON response, adding a Link header pointing at the
+    next page when more items follow.
+    """
+    response = jsonify(data)
+    if last is not None:
+        next_url = url_for(request.endpoint, after_list=last[0], after=last[1], limit=limit)
+        response.headers['Link'] = f'<{next_url}>; rel="next"'
+    return response
+
+
+def lists_data_of_page(lists, rows, after_list):
+    """
+    Build the JSON of a page's lists, each with an empty items list to fill
+    in. The list the previous page ended in is only repeated when this page
+    has more of its items.
+    :return: The lists' data and the same dicts by list ID.
+    """
+    if after_list and lists and lists[0].id == after_list and all(row.list_id != after_list for row in rows):
+        lists = lists[1:]
+    lists_data = [{'id': todo_list.id, 'title': todo_list.title, **list_progress(todo_list), 'items': []}
+                  for todo_list in lists]
+    return lists_data, {list_data['id']: list_data for list_data in lists_data}
+
+
+# Progress counters loaded with items, see item_progress()
+PROGRESS_COLUMNS = (TodoItem.descendant_count, TodoItem.completed_descendant_count, TodoItem.open_descendant_count)
+
+
+def list_progress(todo_list):
+    """
+    Return the progress counters of a list for its JSON, read straight from its row.
+    """
+    return {
+        'item_count': todo_list.item_count,
+        'completed_count': todo_list.completed_count,
+        'open_count': todo_list.open_count,
+    }
+
+
+def item_progress(row):
+    """
+    Return the progress counters of an item's sub-items at any depth for its
+    JSON, from a row loaded with PROGRESS_COLUMNS.
+    """
+    return {
+        'descendant_count': row.descendant_count,
+        'completed_descendant_count': row.completed_descendant_count,
+        'open_descendant_count': row.open_descendant_count,
+    }
+
+
+def load_todo_tree(user_id, after_list=0, after=0, limit=None):
+    """
+    Load a page of a user's todo lists together with their nested items.
+    Pages are counted in top-level items, each sent with all of its
+    sub-items. All of the page's items are fetched in one flat query and the
+    sub_items hierarchy is assembled in memory, so the number of queries
+    stays fixed no matter how large or deep the tree is.
+    :param user_id: ID of the user whose lists should be loaded.
+    :param after_list: List ID of the last top-level item on the previous page, or 0.
+    :param after: ID of the last top-level item on the previous page, or 0.
+    :param limit: Number of top-level items per page, or None for all of them.
+    :return: The page's data and the (list ID, item ID) of its last top-level item, or None on the last page.
+    """
+    last = last_of_page(user_id, after_list, after, limit, top_level=True)
+    lists = lists_of_page(user_id, after_list, last)
+    if not lists:
+        return [], last
+
+    columns = (TodoItem.id, TodoItem.content, TodoItem.completed, TodoItem.list_id, TodoItem.parent_id,
+               *PROGRESS_COLUMNS)
+    if limit is None:
+        rows = page_items_query(user_id, 0, 0, None, *columns).order_by(TodoItem.id).all()
+    else:
+        # The page's top-level items, then their subtrees as one range of paths each
+        paths = [path for (path,) in page_items_query(user_id, after_list, after, last, TodoItem.path)
+                 .filter(TodoItem.parent_id.is_(None))]
+        rows = []
+        if paths:
+            rows = (db.session.query(*columns).filter(db.or_(*(subtree_filter(path) for path in paths)))
+                    .order_by(TodoItem.id).all())
+
+    lists_data, lists_by_id = lists_data_of_page(lists, rows, after_list)
+
+    # First pass creates a node for every item, second pass hangs each node
+    # under its parent (or its list, for top-level items)
+    nodes = {}
+    for row in rows:
+        nodes[row.id] = {
+            'id': row.id,
+            'content': row.content,
+            'completed': row.completed,
+            **item_progress(row),
+            'sub_items': []
+        }
+
+    for row in rows:
+        if not row.parent_id:  # Only top-level items go directly into the list
+            lists_by_id[row.list_id]['items'].append(nodes[row.id])
+        elif row.parent_id in nodes:
+            nodes[row.parent_id]['sub_items'].append(nodes[row.id])
+
+    return lists_data, last
+
+
+def stream_todo_rows(user_id, after=0, limit=None):
+    """
+    Generate a user's lists and items as newline-delimited JSON.
+    One line is written per list and then one per item, with parents always
+    coming before their sub-items. Rows are read in batches from a streaming
+    cursor and written out in chunks, so memory use doesn't grow with the data.
+    :param user_id: ID of the user whose lists should be streamed.
+    :param after: Only lists with an ID greater than this are streamed.
+    :param limit: Maximum number of lists to stream, or None for all of them.
+    """
+    lists_select = (db.select(TodoList.id, TodoList.title)
+                   .where(TodoList.user_id == user_id, TodoList.id > after)
+                   .order_by(TodoList.id))
+    if limit is not None:
+        lists_select = lists_select.limit(limit)
+    page = lists_select.subquery()
+
+    items_select = (db.select(TodoItem.id, TodoItem.list_id, TodoItem.parent_id,
+                             TodoItem.content, TodoItem.completed)
+                   .join(page, TodoItem.list_id == page.c.id)
+                   .order_by(TodoItem.path))  # A parent's path is a prefix of its sub-items' paths
+
+    chunk = []
+    chunk_size = 0
+    connection = db.session.connection()  # Executing on the connection skips building ORM results
+    for row_type, query in (('list', lists_select), ('item', items_select)):
+        result = connection.execute(query.execution_options(yield_per=1000))
+        keys = ('type',) + tuple(result.keys())
+        for row in result:
+            line = json.dumps(dict(zip(keys, (row_type, *row)))) + '\n'
+            chunk.append(line)
+            chunk_size += len(line)
+            if chunk_size >= 65536:
+                yield ''.join(chunk)
+                chunk = []
+                chunk_size = 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def ndjson_response(user_id, after, limit):
+    """
+    Stream a page of a user's lists and items as an NDJSON response.
+    """
+    return Response(stream_with_context(stream_todo_rows(user_id, after, limit)),
+                    mimetype='application/x-ndjson')
+
+
+def cached_page_response(user_id, load_page):
+    """
+    Serve a page of lists and items through the per-user response cache.
+    The ETag is built from the user's data version, so a client that already
+    has the current data gets an empty 304 before any list or item is loaded,
+    and a cache hit skips loading and serializing them.
+    :param user_id: ID of the user whose lists are being read.
+    :param load_page: Function loading a page's JSON data, returning it with the page's last item (see load_todo_tree).
+    """
+    version = data_version(user_id)
+    etag = f'{user_id}.{version}'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        key = (user_id, version, request.full_path)
+        entry = response_cache.get(key)
+        if entry is None:
+            after_list, after, limit = page_args()
+            data, last = load_page(user_id, after_list, after, limit)
+            page = paginated_response(data, last, limit)
+            entry = (page.get_data(), page.headers.get('Link'))
+            response_cache.put(key, entry)
+
+        body, link = entry
+        response = Response(body, mimetype='application/json')
+        if link:
+            response.headers['Link'] = link
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'  # Browsers must revalidate with the ETag
+    return response
+
+
 @app.route('/get-todo-lists-items', methods=['GET'])
 def get_todo_lists_items():
-    lists = TodoList.query.all()
-    lists_data = []
-
-    for list in lists:
-        list_items = []
-        for item in list.items:
-            if not item.parent_id:  # Only top-level items
-                list_items.append({
-                    'id': item.id,
-                    'content': item.content,
-                    'completed': item.completed,
-                    'sub_items': get_sub_items(item.sub_items)  # Recursive function to get sub-items
-                })
-        lists_data.append({
-            'id': list.id,
-            'title': list.title,
-            'items': list_items
-        })
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({"message": "Please log in."}), 401
 
+    if request.args.get('stream'):
+        after_list, _, limit = page_args()  # Streams are paged by whole lists
+        return ndjson_response(user_id, after_list, limit)
 
-    return jsonify(lists_data)
+    return cached_page_response(user_id, load_todo_tree)
 
 
-def get_sub_items(sub_items):
-    items = []
-    for item in sub_items:
-        items.append({
+def load_todo_items(user_id, after_list=0, after=0, limit=None):
+    """
+    Load a page of a user's todo lists with a flat list of each one's items.
+    :param user_id: ID of the user whose lists should be loaded.
+    :param after_list: List ID of the last item on the previous page, or 0.
+    :param after: ID of the last item on the previous page, or 0.
+    :param limit: Number of items per page, or None for all of them.
+    :return: The page's data and the (list ID, item ID) of its last item, or None on the last page.
+    """
+    last = last_of_page(user_id, after_list, after, limit)
+    todo_lists = lists_of_page(user_id, after_list, last)
+    if not todo_lists:
+        return [], last
+
+    # All of the page's items are fetched at once
+    items = (page_items_query(user_id, after_list, after, last, TodoItem.id, TodoItem.content,
+                              TodoItem.completed, TodoItem.list_id, *PROGRESS_COLUMNS)
+             .order_by(TodoItem.list_id, TodoItem.id).all())
+    lists_data, lists_by_id = lists_data_of_page(todo_lists, items, after_list)
+
+    # Adding each item to the list_data dictionary of the list it belongs to
+    for item in items:
+        lists_by_id[item.list_id]['items'].append({
             'id': item.id,
             'content': item.content,
             'completed': item.completed,
-            'sub_items': get_sub_items(item.sub_items)
+            **item_progress(item)
         })
-    return items
+
+    return lists_data, last
 
 
 @app.route('/get-todo-items', methods=['GET'])
 def get_todo_items():
-    # Querying all todo lists and their items from the database
-    todo_lists = TodoList.query.all()
-
-    # Creating a list to hold the todo lists and their items
-    lists_data = []
-
-    for todo_list in todo_lists:
-        # Creating a dictionary to hold each todo list and its items
-        list_data = {
-            'id': todo_list.id,
-            'title': todo_list.title,
-            'items': []
-        }
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({"message": "Please log in."}), 401
+
+    if request.args.get('stream'):
+        after_list, _, limit = page_args()  # Streams are paged by whole lists
+        return ndjson_response(user_id, after_list, limit)
+
+    return cached_page_response(user_id, load_todo_items)
+
+
+def load_changes(user_id, since, until=None, limit=None):
+    """
+    Load everything that changed in a user's lists after a change sequence.
+    A since of 0 loads all of the user's lists and items, with no deletions.
+    :param user_id: ID of the user whose changes should be loaded.
+    :param since: Change sequence (data version) the client is up to date with.
+    :param until: Last change sequence to include, e.g. to load the changes of a single transaction.
+    :param limit: Most lists, items and deleted IDs to load of each kind, or None for all of them.
+    """
+    # Reading the version first, so every change up to it is included below
+    seq = data_version(user_id) if until is None else until
+
+    lists = (db.session.query(TodoList.id, TodoList.title, TodoList.item_count, TodoList.completed_count,
+                              TodoList.open_count)
+             .filter(TodoList.user_id == user_id)
+             .order_by(TodoList.id))
+    items = (db.session.query(TodoItem.id, TodoItem.list_id, TodoItem.parent_id,
+                              TodoItem.content, TodoItem.completed, *PROGRESS_COLUMNS)
+             .join(TodoList, TodoItem.list_id == TodoList.id)
+             .filter(TodoList.user_id == user_id)
+             .order_by(TodoItem.path))  # Parents before their sub-items
+
+    deleted = {'lists': [], 'items': []}
+    if since > 0 or until is not None:
+        lists = lists.filter(TodoList.change_seq > since, TodoList.change_seq <= seq)
+        items = items.filter(TodoItem.change_seq > since, TodoItem.change_seq <= seq)
+        tombstones = (db.session.query(Tombstone.kind, Tombstone.object_id)
+                      .filter(Tombstone.user_id == user_id, Tombstone.change_seq > since,
+                              Tombstone.change_seq <= seq)
+                      .order_by(Tombstone.id))
+        if limit is not None:
+            tombstones = tombstones.limit(limit)
+        for kind, object_id in tombstones:
+            deleted[kind + 's'].append(object_id)
+
+    if limit is not None:
+        lists = lists.limit(limit)
+        items = items.limit(limit)
+
+    return {
+        'seq': seq,
+        'lists': [row._asdict() for row in lists],
+        'items': [row._asdict() for row in items],
+        'deleted': deleted,
+    }
+
+
+@app.route('/changes', methods=['GET'])
+def get_changes():
+    """
+    Return the lists and items created or modified after ?since=<seq> and the
+    IDs of those deleted since then. Clients apply the deletions first, then
+    the rows, and pass the returned seq as their next ?since= value.
+    Like the other read endpoints, the ETag is the user's data version, so a
+    client polling with nothing new gets an empty 304.
+    """
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({"message": "Please log in."}), 401
+
+    etag = f'{user_id}.{data_version(user_id)}'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        changes = load_changes(user_id, request.args.get('since', 0, type=int))
+        response = jsonify(changes)
+        etag = f"{user_id}.{changes['seq']}"  # The version the response is up to date with
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'  # Browsers must revalidate with the ETag
+    return response
+
 
-        # Adding each item in the current todo list to the list_data dictionary
-        for item in todo_list.items:
-            item_data = {
-                'id': item.id,
-                'content': item.content,
-                'completed': item.completed
-            }
-            list_data['items'].append(item_data)
+def stream_change_events(user_id, last_event_id, current_seq):
+    """
+    Generate the Server-Sent Events of a user's /events stream: every change
+    event after last_event_id, a heartbeat comment whenever the stream is idle,
+    and a resync event when the missed events are no longer buffered and the
+    client has to catch up through /changes. Idle streams also compare the
+    user's data version with the last event, so writes whose events never
+    reach this process (several workers without a hub) still cause a resync
+    within one heartbeat.
+    :param user_id: ID of the subscribed user.
+    :param last_event_id: Change sequence the client is up to date with.
+    :param current_seq: The user's data version when the stream was opened.
+    """
+    broker = get_broker()
+    heartbeat = app.config['EVENT_HEARTBEAT_SECONDS']
+    yield 'retry: 3000\n\n'  # Reconnecting after 3 seconds if the connection drops
+
+    behind = last_event_id < current_seq
+    while True:
+        events = broker.wait_for_events(user_id, last_event_id, 0 if behind else heartbeat)
+        if events is None or (behind and not events):
+            # Skipping to the newest known change; the event ID lets the client resume from there
+            since = last_event_id
+            last_event_id = max(current_seq, broker.latest_event_id(user_id))
+            yield f'id: {last_event_id}\nevent: resync\ndata: {json.dumps({"since": since})}\n\n'
+        elif events:
+            for event_id, changes in events:
+                yield f'id: {event_id}\nevent: change\ndata: {json.dumps(changes)}\n\n'
+            last_event_id = events[-1][0]
+        else:
+            with app.app_context():  # The stream outlives the request's context
+                seq = data_version(user_id)
+            if seq > last_event_id:
+                since, last_event_id = last_event_id, seq
+                yield f'id: {last_event_id}\nevent: resync\ndata: {json.dumps({"since": since})}\n\n'
+            else:
+                yield ': heartbeat\n\n'  # Keeping proxies from closing the idle connection
+        behind = False
+
+
+@app.route('/events', methods=['GET'])
+def get_events():
+    """
+    Stream the user's change events as Server-Sent Events. Each event carries
+    the same data as /changes for a single transaction and its seq as the event
+    ID, so clients resume from the Last-Event-ID header (or ?since= on the first
+    connection) and apply the events in order.
+    """
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({"message": "Please log in."}), 401
+
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    if last_event_id is None:
+        last_event_id = request.args.get('since', 0, type=int)
+    current_seq = data_version(user_id)
+    last_event_id = min(last_event_id, current_seq)
 
-        # Adding the list_data dictionary to the lists_data list
-        lists_data.append(list_data)
+    if not event_streams.acquire(user_id):
+        return jsonify({"message": "Too many open event streams."}), 429
 
-    # Returning the lists_data as JSON
-    return jsonify(lists_data)
+    response = Response(stream_change_events(user_id, last_event_id, current_seq),
+                        mimetype='text/event-stream')
+    response.call_on_close(lambda: event_streams.release(user_id))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Asking nginx not to buffer the stream
+    return response
 
 
 @app.route('/move-item/<int:item_id>', methods=['PUT'])
 def move_item(item_id):
     data = request.get_json()
     new_list_id = data.get('new_list_id')
+    new_parent_id = data.get('new_parent_id', None)
 
     todo_item = TodoItem.query.get(item_id)
-    if todo_item:
-        todo_item.list_id = new_list_id
+    if not todo_item:
+        return jsonify({"message": "Todo item not found."}), 404
+
+    new_parent = None
+    if new_parent_id:
+        new_parent = TodoItem.query.get(new_parent_id)
+        if not new_parent:
+            return jsonify({"message": "Parent item not found."}), 404
+        if new_parent.path.startswith(todo_item.path):  # Can't move an item underneath itself
+            return jsonify({"message": "Cannot move an item into its own sub-items."}), 400
+    elif not TodoList.query.get(new_list_id):
+        return jsonify({"message": "Todo list not found."}), 404
+
+    # Moving the whole subtree, so sub-items follow their parent into the new list
+    move_subtree(todo_item, new_list_id, new_parent)
+    db.session.commit()
+    return jsonify({"message": "Todo item moved successfully."}), 200
+
+
+@app.route('/todoitem/<int:item_id>/ancestors', methods=['GET'])
+def get_item_ancestors(item_id):
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({"message": "Please log in."}), 401
+
+    todo_item = (TodoItem.query.join(TodoList, TodoItem.list_id == TodoList.id)
+                 .filter(TodoItem.id == item_id, TodoList.user_id == user_id).first())
+    if not todo_item:  # Other users' items are reported as missing too
+        return jsonify({"message": "Todo item not found."}), 404
+
+    ancestors = [{'id': item.id, 'content': item.content, 'completed': item.completed, **item_progress(item)}
+                 for item in get_ancestors(todo_item)]
+    return jsonify({'id': todo_item.id, 'depth': todo_item.depth, 'ancestors': ancestors})
+
+
+def search_index_available():
+    """
+    Tell whether the database has the FTS5 search index of migration 0007,
+    with the owner tokens added by migration 0009.
+    Checked once per process, as the schema doesn't change while it runs.
+    """
+    if 'search_index' not in app.extensions:
+        inspector = db.inspect(db.engine)
+        app.extensions['search_index'] = (db.engine.dialect.name == 'sqlite'
+                                          and inspector.has_table('todo_item_fts')
+                                          and 'owner' in {column['name'] for column in
+                                                          inspector.get_columns('todo_item_fts')})
+    return app.extensions['search_index']
+
+
+def search_terms(query):
+    """
+    Split a search query into words, dropping FTS5 operators and punctuation.
+    """
+    return re.findall(r'\w+', query)
+
+
+def search_items(user_id, terms, limit):
+    """
+    Find the user's items containing every term, matched as word prefixes.
+    With the FTS5 index, hits are ranked by BM25 and come with a snippet;
+    otherwise they're found with LIKE and ordered by ID.
+    :param user_id: ID of the user whose items are searched.
+    :param terms: Words to look for.
+    :param limit: Maximum number of hits.
+    :return: List of (row, snippet) pairs, best hit first.
+    """
+    columns = (TodoItem.id, TodoItem.list_id, TodoItem.parent_id, TodoItem.content, TodoItem.completed,
+               TodoItem.path, TodoList.title.label('list_title'))
+
+    if search_index_available():
+        # Quoting every term so it's matched literally, and making it a prefix query. Matching the owner
+        # token too leaves only the user's items for FTS5 to rank, however many other users match.
+        match = ' AND '.join(['owner : "u{}"'.format(user_id)] +
+                             ['content : "{}"*'.format(term.replace('"', '""')) for term in terms])
+        fts = db.table('todo_item_fts', db.column('rowid'))
+        snippet = db.func.snippet(db.literal_column('todo_item_fts'), 0, '\x01', '\x02', '…', 12)
+        rank = db.func.bm25(db.literal_column('todo_item_fts'))
+        query = (db.select(*columns, snippet.label('snippet'))
+                 .select_from(fts)
+                 .join(TodoItem, TodoItem.id == fts.c.rowid)
+                 .join(TodoList, TodoItem.list_id == TodoList.id)
+                 .where(db.literal_column('todo_item_fts').op('MATCH')(match), TodoList.user_id == user_id)
+                 .order_by(rank)
+                 .limit(limit))
+        return [(row, row.snippet) for row in db.session.execute(query)]
+
+    # Without the index, every term has to appear somewhere in the content; \w+ terms may contain _, a LIKE wildcard
+    query = (db.select(*columns)
+             .join(TodoList, TodoItem.list_id == TodoList.id)
+             .where(TodoList.user_id == user_id,
+                    *(TodoItem.content.ilike('%{}%'.format(term.replace('_', '\\_')), escape='\\') for term in terms))
+             .order_by(TodoItem.id)
+             .limit(limit))
+    return [(row, None) for row in db.session.execute(query)]
+
+
+def highlight(snippet):
+    """
+    Turn an FTS5 snippet into HTML: the item text is escaped and the
+    matched words, which the query marks with \\x01 and \\x02, are wrapped in <mark>.
+    """
+    return html.escape(snippet).replace('\x01', '<mark>').replace('\x02', '</mark>')
+
+
+@app.route('/search', methods=['GET'])
+def search():
+    """
+    Search the content of the user's items with ?q=. Every word must match
+    the start of a word in the item. Hits include their list, a highlighted
+    snippet and their ancestors, root first, so they can be shown in context.
+    """
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({"message": "Please log in."}), 401
+
+    terms = search_terms(request.args.get('q', ''))
+    if not terms:
+        return jsonify({"message": "Please enter a search term."}), 400
+    limit = max(1, min(request.args.get('limit', 20, type=int), app.config['MAX_SEARCH_RESULTS']))
+
+    hits = search_items(user_id, terms, limit)
+
+    # Loading the ancestors of every hit with one query, using the IDs in their paths
+    needed = {ancestor_id for row, _ in hits for ancestor_id in ancestor_ids(row.path)}
+    ancestors = {}
+    if needed:
+        ancestors = {item.id: {'id': item.id, 'content': item.content} for item in
+                     db.session.query(TodoItem.id, TodoItem.content).filter(TodoItem.id.in_(needed))}
+
+    results = []
+    for row, snippet in hits:
+        results.append({
+            'id': row.id,
+            'list_id': row.list_id,
+            'list_title': row.list_title,
+            'parent_id': row.parent_id,
+            'content': row.content,
+            'completed': row.completed,
+            'snippet': highlight(snippet) if snippet is not None else html.escape(row.content),
+            'ancestors': [ancestors[ancestor_id] for ancestor_id in ancestor_ids(row.path) if ancestor_id in ancestors],
+        })
+    return jsonify({'results': results})
+
+
+class BatchError(Exception):
+    """
+    Raised when an operation in a /batch request can't be applied.
+    """
+
+    def __init__(self, index, message, status=400):
+        super().__init__(message)
+        self.index = index  # Position of the failing operation in the batch
+        self.message = message
+        self.status = status
+
+
+class TodoBatch:
+    """
+    Applies an ordered list of /batch operations inside the current transaction.
+    Runs of consecutive creates and of consecutive updates are written with bulk
+    statements; complete, move and delete already take one statement per subtree.
+    Operations can refer to items created earlier in the batch by their temp_id.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.owned_lists = {list_id for (list_id,) in db.session.query(TodoList.id).filter_by(user_id=user_id)}
+        self.temp_ids = {}  # Client-side temp_id -> real item ID
+        self.pending_creates = []  # Consecutive create operations waiting to be inserted
+        self.pending_updates = []  # Consecutive update operations waiting to be written
+        self.pending_completed = {}  # Item ID -> completed state the queued updates leave it in
+        self.pending_counts = CountChanges()  # Counter changes of the queued updates
+        self.results = []
+
+    def apply(self, operations):
+        """
+        Apply the operations in order and return one result per operation.
+        :param operations: List of operation dicts, each with an 'op' key.
+        """
+        self.results = [None] * len(operations)
+        self.prefetch(operations)
+
+        for index, operation in enumerate(operations):
+            if not isinstance(operation, dict):
+                raise BatchError(index, "Each operation must be a JSON object.")
+
+            kind = operation.get('op')
+            # Writing out queued creates/updates before anything that might depend on them
+            if kind != 'create':
+                self.flush_creates()
+            if kind != 'update':
+                self.flush_updates()
+
+            if kind == 'create':
+                self.queue_create(index, operation)
+            elif kind == 'update':
+                self.queue_update(index, operation)
+            elif kind == 'complete':
+                todo_item = self.owned_item(index, operation.get('id'))
+                complete_subtree(todo_item)
+                self.results[index] = {'op': kind, 'id': todo_item.id}
+            elif kind == 'move':
+                self.move(index, operation)
+            elif kind == 'delete':
+                todo_item = self.owned_item(index, operation.get('id'))
+                delete_subtree(todo_item)
+                self.results[index] = {'op': kind, 'id': todo_item.id}
+            else:
+                raise BatchError(index, f"Unknown operation '{kind}'.")
+
+        self.flush_creates()
+        self.flush_updates()
+        return self.results
+
+    def prefetch(self, operations):
+        """
+        Load every existing item the batch refers to with one query, so later
+        lookups are served from the session's identity map.
+        """
+        item_ids = set()
+        for operation in operations:
+            if isinstance(operation, dict):
+                for key in ('id', 'parent_id', 'new_parent_id'):
+                    if isinstance(operation.get(key), int):
+                        item_ids.add(operation[key])
+        if item_ids:
+            TodoItem.query.filter(TodoItem.id.in_(item_ids)).all()
+
+    def resolve(self, index, ref):
+        """
+        Turn an item reference into a real item ID. Strings are temp_ids of
+        items created earlier in the batch, anything else is used as is.
+        """
+        if isinstance(ref, str):
+            if ref not in self.temp_ids:
+                raise BatchError(index, f"Unknown temp_id '{ref}'.")
+            return self.temp_ids[ref]
+        return ref
+
+    def check_refs(self, index, operation, list_keys=(), item_keys=()):
+        """
+        Reject list references that aren't IDs and item references that are
+        neither IDs nor temp_ids, before they're looked up.
+        """
+        for keys, types, expected in ((list_keys, int, "an ID"), (item_keys, (int, str), "an ID or a temp_id")):
+            for key in keys:
+                value = operation.get(key)
+                if value is not None and (isinstance(value, bool) or not isinstance(value, types)):
+                    raise BatchError(index, f"{key} must be {expected}.")
+
+    def owned_item(self, index, ref):
+        """
+        Load an item the current user owns, or fail the batch with a 404.
+        """
+        item_id = self.resolve(index, ref)
+        todo_item = db.session.get(TodoItem, item_id) if isinstance(item_id, int) else None
+        if not todo_item or todo_item.list_id not in self.owned_lists:
+            raise BatchError(index, "Todo item not found.", 404)
+        return todo_item
+
+    def queue_create(self, index, operation):
+        content = operation.get('content')
+        if not isinstance(content, str) or not content:
+            raise BatchError(index, "content is required.")
+
+        temp_id = operation.get('temp_id')
+        if temp_id is not None:
+            if not isinstance(temp_id, str):
+                raise BatchError(index, "temp_id must be a string.")
+            if temp_id in self.temp_ids or any(op.get('temp_id') == temp_id for _, op in self.pending_creates):
+                raise BatchError(index, f"Duplicate temp_id '{temp_id}'.")
+        self.check_refs(index, operation, list_keys=('list_id',), item_keys=('parent_id',))
+
+        self.pending_creates.append((index, operation))
+
+    def flush_creates(self):
+        """
+        Insert the queued creates with a single executemany INSERT.
+        IDs are allocated up front so every path, including those of items
+        whose parent is created in the same run, is known before inserting.
+        """
+        pending, self.pending_creates = self.pending_creates, []
+        if not pending:
+            return
+
+        # Loading the already existing parents of this run in one query
+        run_temp_ids = {op['temp_id'] for _, op in pending if op.get('temp_id') is not None}
+        parent_ids = {self.resolve(index, op['parent_id']) for index, op in pending
+                      if op.get('parent_id') is not None and op['parent_id'] not in run_temp_ids}
+        nodes = {}  # Item ID -> (list_id, path, depth) for every possible parent
+        if parent_ids:
+            for parent in TodoItem.query.filter(TodoItem.id.in_(parent_ids)):
+                if parent.list_id in self.owned_lists:
+                    nodes[parent.id] = (parent.list_id, parent.path, parent.depth)
+
+        rows = []
+        for (index, operation), new_id in zip(pending, allocate_ids(TodoItem, len(pending))):
+            parent_ref = operation.get('parent_id')
+            if parent_ref is None:
+                list_id, parent_id, path, depth = operation.get('list_id'), None, '/', 0
+                if list_id not in self.owned_lists:
+                    raise BatchError(index, "Todo list not found.", 404)
+            else:
+                parent_id = self.resolve(index, parent_ref)  # Temp IDs of this run resolve once their create is reached
+                if parent_id not in nodes:
+                    raise BatchError(index, "Parent item not found.", 404)
+                list_id, path, depth = nodes[parent_id]
+                depth += 1
+
+            path += f'{new_id}/'
+            nodes[new_id] = (list_id, path, depth)
+            if operation.get('temp_id') is not None:
+                self.temp_ids[operation['temp_id']] = new_id
+            rows.append({'id': new_id, 'content': operation['content'], 'list_id': list_id,
+                         'parent_id': parent_id, 'completed': bool(operation.get('completed', False)),
+                         'path': path, 'depth': depth, 'change_seq': bump_data_version(self.user_id)})
+            self.results[index] = {'op': 'create', 'id': new_id, 'temp_id': operation.get('temp_id')}
+
+        # New items start out with the counts of their new sub-items; existing parents and lists are updated after
+        counts = CountChanges()
+        counts.add_new_items(rows, bump_data_version(self.user_id))
+        counts.fill_new_rows([], rows)
+        db.session.execute(db.insert(TodoItem.__table__), rows)  # Core INSERT, so every row goes into one executemany
+        counts.apply()
+
+    def queue_update(self, index, operation):
+        todo_item = self.owned_item(index, operation.get('id'))
+        values = {}
+        if 'content' in operation:
+            if not isinstance(operation['content'], str) or not operation['content']:
+                raise BatchError(index, "content must be a non-empty string.")
+            values['content'] = operation['content']
+        if 'completed' in operation:
+            values['completed'] = bool(operation['completed'])
+            # Earlier updates of this run aren't written yet, so the item may not be in its loaded state
+            was_completed = self.pending_completed.get(todo_item.id, bool(todo_item.completed))
+            self.pending_completed[todo_item.id] = values['completed']
+            if values['completed'] != was_completed:
+                self.pending_counts.add(todo_item.list_id, ancestor_ids(todo_item.path), 0,
+                                        1 if values['completed'] else -1, bump_data_version(self.user_id))
+
+        if values:
+            values['change_seq'] = bump_data_version(self.user_id)
+        self.pending_updates.append({'id': todo_item.id, **values})
+        self.results[index] = {'op': 'update', 'id': todo_item.id}
+
+    def flush_updates(self):
+        """
+        Write the queued updates as bulk UPDATEs by primary key.
+        """
+        pending, self.pending_updates = self.pending_updates, []
+        pending = [values for values in pending if len(values) > 1]  # Skipping updates that change nothing
+        self.pending_completed = {}
+        if not pending:
+            return
+
+        db.session.execute(db.update(TodoItem), pending)
+        self.pending_counts.apply()
+        db.session.expire_all()  # Bulk UPDATEs by primary key don't refresh objects already in the session
+
+    def move(self, index, operation):
+        self.check_refs(index, operation, list_keys=('new_list_id',), item_keys=('new_parent_id',))
+        todo_item = self.owned_item(index, operation.get('id'))
+        new_list_id = operation.get('new_list_id')
+        new_parent = None
+        if operation.get('new_parent_id') is not None:
+            new_parent = self.owned_item(index, operation['new_parent_id'])
+            if new_parent.path.startswith(todo_item.path):
+                raise BatchError(index, "Cannot move an item into its own sub-items.")
+        elif new_list_id not in self.owned_lists:
+            raise BatchError(index, "Todo list not found.", 404)
+
+        move_subtree(todo_item, new_list_id, new_parent)
+        self.results[index] = {'op': 'move', 'id': todo_item.id}
+
+
+@app.route('/batch', methods=['POST'])
+def apply_batch():
+    """
+    Apply an ordered array of create/update/complete/move/delete operations in
+    a single transaction. Either every operation is applied or none is.
+    """
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({"message": "Please log in."}), 401
+
+    operations = request.get_json()
+    if not isinstance(operations, list):
+        return jsonify({"message": "Expected a JSON array of operations."}), 400
+    if len(operations) > app.config['MAX_BATCH_SIZE']:
+        return jsonify({"message": f"A batch can hold at most {app.config['MAX_BATCH_SIZE']} operations."}), 400
+
+    try:
+        results = TodoBatch(user_id).apply(operations)
+    except BatchError as error:
+        db.session.rollback()  # Undoing every operation that was already applied
+        return jsonify({"message": error.message, "index": error.index}), error.status
+
+    db.session.commit()  # One commit for the whole batch
+    return jsonify({"results": results}), 200
+
+
+@app.cli.command('event-hub')
+def event_hub():
+    """Run the hub that relays change events between worker processes."""
+    if not app.config['EVENT_HUB_AUTHKEY']:
+        raise click.ClickException('Set EVENT_HUB_AUTHKEY to a shared secret, in the hub\'s and every worker\'s '
+                                   'environment.')
+    address = parse_hub_url(app.config['EVENT_BROKER_URL'] or 'hub://127.0.0.1:6300')
+    click.echo(f'Relaying change events on {address[0]}:{address[1]}', err=True)
+    run_hub(address, app.config['EVENT_HUB_AUTHKEY'].encode())
+
+
+@app.route('/export', methods=['GET'])
+def export_todos():
+    """
+    Download all of the user's lists and items as NDJSON, in the format /import reads.
+    """
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({"message": "Please log in."}), 401
+
+    response = ndjson_response(user_id, 0, None)
+    response.headers['Content-Disposition'] = 'attachment; filename=todos.ndjson'
+    return response
+
+
+class ImportLineError(Exception):
+    """
+    Raised when a line of an import can't be imported.
+    """
+
+    def __init__(self, line, message):
+        super().__init__(message)
+        self.line = line  # Number of the failing line, starting at 1
+        self.message = message
+
+
+class TodoImport:
+    """
+    Imports NDJSON lines as written by /export ({"type": "list", "id", "title"}
+    and {"type": "item", "id", "list_id", "parent_id", "content", "completed"})
+    into a user's account as new lists and items. Parents must come before
+    their sub-items. Lines are read as a stream and imported in chunks, each
+    with bulk INSERTs in its own transaction, and the job row records how far
+    the import got, so a failed import can be resumed with the same input.
+    """
+
+    def __init__(self, job, chunk_size):
+        self.job = job
+        self.job_id = job.id
+        self.user_id = job.user_id
+        self.chunk_size = chunk_size
+
+    def run(self, lines, progress=None):
+        """
+        Import the lines that are not imported yet, and return the job.
+        :param lines: Iterable of NDJSON lines (str or bytes), from the start of the input.
+        :param progress: Function called with the job after every committed chunk.
+        """
+        lines_done = self.job.lines_done
+        chunk = []
+        try:
+            for number, line in enumerate(lines, 1):
+                if number <= lines_done:
+                    continue  # Imported before the import was interrupted
+                chunk.append((number, line))
+                if len(chunk) >= self.chunk_size:
+                    self.import_chunk(chunk)
+                    chunk = []
+                    if progress:
+                        progress(self.job)
+            if chunk:
+                self.import_chunk(chunk)
+                if progress:
+                    progress(self.job)
+        except ImportLineError as error:
+            return self.fail(f"Line {error.line}: {error.message}")
+        except Exception as error:
+            # Not leaving the job 'running' forever; the error itself still propagates
+            self.fail(f"Unexpected error: {error!r}")
+            raise
+
+        # The ID mappings are only needed to resume, which a finished job never is
+        db.session.execute(db.delete(ImportIdMap).where(ImportIdMap.job_id == self.job_id))
+        self.job.status = 'done'
+        db.session.commit()
+        return self.job
+
+    def fail(self, message):
+        """
+        Undo the failing chunk and record the error on the job.
+        """
+        db.session.rollback()
+        self.job = db.session.get(ImportJob, self.job_id)
+        self.job.status = 'failed'
+        self.job.error = message
+        db.session.commit()
+        return self.job
+
+    def parse(self, chunk):
+        """
+        Decode and check the lines of a chunk.
+        :return: List of (line number, row dict) of the non-empty lines.
+        """
+        rows = []
+        for number, line in chunk:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                raise ImportLineError(number, "Invalid JSON.")
+            if not isinstance(row, dict) or row.get('type') not in ('list', 'item') or row.get('id') is None:
+                raise ImportLineError(number, "Expected a list or item with an id.")
+            if row['type'] == 'list' and not isinstance(row.get('title'), str):
+                raise ImportLineError(number, "A list needs a title.")
+            if row['type'] == 'item' and not isinstance(row.get('content'), str):
+                raise ImportLineError(number, "An item needs a content.")
+            if row['type'] == 'item' and row.get('parent_id') is None and row.get('list_id') is None:
+                raise ImportLineError(number, "A top-level item needs a list_id.")
+            rows.append((number, row))
+        return rows
+
+    def lookup(self, kind, source_ids):
+        """
+        Look up the lists or items that earlier chunks created for source IDs.
+        :return: Dictionary of source ID -> list ID for lists, or
+                 source ID -> (item ID, list ID, path, depth) for items.
+        """
+        if kind == 'list':
+            query = db.session.query(ImportIdMap.source_id, ImportIdMap.target_id)
+        else:
+            query = (db.session.query(ImportIdMap.source_id, TodoItem.id, TodoItem.list_id, TodoItem.path,
+                                      TodoItem.depth)
+                     .join(TodoItem, TodoItem.id == ImportIdMap.target_id))
+
+        found = {}
+        source_ids = list(source_ids)
+        for start in range(0, len(source_ids), 500):  # Staying under SQLite's limit of bound parameters
+            for source_id, *target in query.filter(ImportIdMap.job_id == self.job_id, ImportIdMap.kind == kind,
+                                                   ImportIdMap.source_id.in_(source_ids[start:start + 500])):
+                found[source_id] = target[0] if kind == 'list' else tuple(target)
+        return found
+
+    def import_chunk(self, chunk):
+        """
+        Import a chunk of lines in one transaction: every list, item and ID
+        mapping is written with a single executemany INSERT per table.
+        """
+        rows = self.parse(chunk)
+        lists = {}  # Source list ID -> target list ID
+        nodes = {}  # Source item ID -> (target ID, list ID, path, depth)
+
+        # Resolving the references to lists and items of earlier chunks in bulk
+        list_refs = {str(row.get('list_id')) for _, row in rows
+                     if row['type'] == 'item' and row.get('parent_id') is None}
+        item_refs = {str(row['parent_id']) for _, row in rows
+                     if row['type'] == 'item' and row.get('parent_id') is not None}
+        lists.update(self.lookup('list', list_refs))
+        nodes.update(self.lookup('item', item_refs))
+
+        list_count = sum(1 for _, row in rows if row['type'] == 'list')
+        list_ids = iter(allocate_ids(TodoList, list_count))
+        item_ids = iter(allocate_ids(TodoItem, len(rows) - list_count))
+        seq = bump_data_version(self.user_id)
+        list_rows, item_rows, id_map_rows = [], [], []
+
+        for number, row in rows:
+            source_id = str(row['id'])
+            if row['type'] == 'list':
+                if source_id in lists:
+                    raise ImportLineError(number, f"Duplicate list id {row['id']}.")
+                lists[source_id] = new_id = next(list_ids)
+                list_rows.append({'id': new_id, 'title': row['title'], 'user_id': self.user_id, 'change_seq': seq})
+            else:
+                if source_id in nodes:
+                    raise ImportLineError(number, f"Duplicate item id {row['id']}.")
+                new_id = next(item_ids)
+                if row.get('parent_id') is None:
+                    list_id = lists.get(str(row.get('list_id')))
+                    if list_id is None:
+                        raise ImportLineError(number, f"Unknown list id {row.get('list_id')}.")
+                    parent_id, path, depth = None, '/', 0
+                else:
+                    if str(row['parent_id']) not in nodes:
+                        raise ImportLineError(number, f"Unknown parent id {row['parent_id']}.")
+                    parent_id, list_id, path, depth = nodes[str(row['parent_id'])]
+                    depth += 1  # Sub-items always live in their parent's list
+                path += f'{new_id}/'
+                nodes[source_id] = (new_id, list_id, path, depth)
+                item_rows.append({'id': new_id, 'content': row['content'], 'list_id': list_id,
+                                  'parent_id': parent_id, 'completed': bool(row.get('completed', False)),
+                                  'path': path, 'depth': depth, 'change_seq': seq})
+            id_map_rows.append({'job_id': self.job_id, 'kind': row['type'], 'source_id': source_id,
+                                'target_id': new_id})
+
+        # Counting the new items into their lists and parents, here or in earlier chunks
+        counts = CountChanges()
+        counts.add_new_items(item_rows, seq)
+        counts.fill_new_rows(list_rows, item_rows)
+
+        try:
+            if list_rows:
+                db.session.execute(db.insert(TodoList.__table__), list_rows)
+            if item_rows:
+                db.session.execute(db.insert(TodoItem.__table__), item_rows)
+            if id_map_rows:
+                db.session.execute(db.insert(ImportIdMap.__table__), id_map_rows)
+            counts.apply()
+        except IntegrityError:
+            # An ID of this chunk was already imported by an earlier one
+            raise ImportLineError(chunk[0][0], "Duplicate list or item id in this chunk.")
+
+        self.job.lines_done = chunk[-1][0]
+        self.job.lists_imported += len(list_rows)
+        self.job.items_imported += len(item_rows)
+        db.session.info['bulk_changes'] = True  # Clients resync from /changes rather than get the rows as events
         db.session.commit()
-        return jsonify({"message": "Todo item moved successfully."}), 200
+
+
+def start_import_job(user_id, job_id=None):
+    """
+    Create an import job for a user, or reopen one of their failed imports
+    to resume it. Returns None if the user has no import with that ID.
+    :param user_id: ID of the user to import for.
+    :param job_id: ID of the import to resume, or None for a new import.
+    """
+    if job_id is None:
+        job = ImportJob(user_id=user_id)
+        db.session.add(job)
     else:
-        return jsonify({"message": "Todo item not found."}), 404
+        job = db.session.get(ImportJob, job_id)
+        if not job or job.user_id != user_id:
+            return None
+        if job.status != 'done':
+            job.status = 'running'
+            job.error = None
+    db.session.commit()
+    return job
+
+
+def import_job_data(job):
+    return {
+        'id': job.id,
+        'status': job.status,
+        'lines_done': job.lines_done,
+        'lists_imported': job.lists_imported,
+        'items_imported': job.items_imported,
+        'error': job.error,
+    }
+
+
+@app.route('/import', methods=['POST'])
+def import_todos():
+    """
+    Import NDJSON lists and items (as exported by /export) from the request
+    body into the user's account. If the import fails, send the same body
+    again with ?job=<id> to resume after the last committed chunk.
+    """
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({"message": "Please log in."}), 401
+
+    job = start_import_job(user_id, request.args.get('job', type=int))
+    if not job:
+        return jsonify({"message": "Import not found."}), 404
+    if job.status == 'done':
+        return jsonify(import_job_data(job)), 200  # Already imported, nothing to resume
+
+    job = TodoImport(job, app.config['IMPORT_CHUNK_SIZE']).run(request.stream)
+    return jsonify(import_job_data(job)), 200 if job.status == 'done' else 400
+
+
+@app.route('/import/<int:job_id>', methods=['GET'])
+def get_import(job_id):
+    """
+    Report the progress of an import.
+    """
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({"message": "Please log in."}), 401
+
+    job = db.session.get(ImportJob, job_id)
+    if not job or job.user_id != user_id:
+        return jsonify({"message": "Import not found."}), 404
+    return jsonify(import_job_data(job)), 200
+
+
+@app.cli.command('export-todos')
+@click.argument('user_id', type=int)
+@click.argument('output', type=click.File('w'), default='-')
+def export_todos_command(user_id, output):
+    """Write a user's lists and items as NDJSON to OUTPUT (default: stdout)."""
+    for chunk in stream_todo_rows(user_id):
+        output.write(chunk)
+
+
+@app.cli.command('import-todos')
+@click.argument('user_id', type=int)
+@click.argument('input', type=click.File('rb'))
+@click.option('--resume', 'job_id', type=int, help='ID of a failed import to resume.')
+@click.option('--chunk-size', type=int, help='Lines per transaction.')
+def import_todos_command(user_id, input, job_id, chunk_size):
+    """Import NDJSON lists and items from INPUT for a user."""
+    job = start_import_job(user_id, job_id)
+    if not job:
+        raise click.ClickException(f'No import {job_id} for user {user_id}.')
+
+    def report(job):
+        click.echo(f'Import {job.id}: {job.lines_done} lines, {job.lists_imported} lists, '
+                   f'{job.items_imported} items', err=True)
+
+    with write_transaction():
+        job = TodoImport(job, chunk_size or app.config['IMPORT_CHUNK_SIZE']).run(input, report)
+    if job.status != 'done':
+        raise click.ClickException(f'Import {job.id} failed: {job.error} '
+                                   f'(resume with --resume {job.id} once the input is fixed)')
+    click.echo(f'Import {job.id} done.', err=True)
+
+
+def recount_progress(user_id):
+    """
+    Recompute the progress counters of a user's lists and items from their
+    items and fix those that are wrong, stamping them with a new change
+    sequence so clients pick up the fixes. Items are read as a stream ordered
+    by path, so each subtree is contiguous and only the ancestors of the
+    current item are kept in memory.
+    :param user_id: ID of the user whose counters should be repaired (None for lists without a user).
+    :return: Number of lists and items that were fixed.
+    """
+    lists = {todo_list.id: [todo_list.item_count, todo_list.completed_count, 0, 0]
+             for todo_list in db.session.query(TodoList.id, TodoList.item_count, TodoList.completed_count)
+             .filter(TodoList.user_id == user_id)}
+    items = (db.select(TodoItem.id, TodoItem.list_id, TodoItem.path, TodoItem.completed,
+                       TodoItem.descendant_count, TodoItem.completed_descendant_count)
+             .join(TodoList, TodoItem.list_id == TodoList.id)
+             .where(TodoList.user_id == user_id)
+             .order_by(TodoItem.path))
+
+    fixed_items = []
+    open_items = []  # [path, ID, stored counts, counted descendants, counted completed ones] of the current ancestors
+
+    def close(entry):
+        path, item_id, stored, total, completed = entry
+        if stored != (total, completed):
+            fixed_items.append({'id': item_id, 'descendant_count': total, 'completed_descendant_count': completed})
+
+    for row in db.session.connection().execute(items.execution_options(yield_per=1000)):
+        while open_items and not row.path.startswith(open_items[-1][0]):
+            close(open_items.pop())  # Past the end of that item's subtree
+        completed = int(bool(row.completed))
+        for entry in open_items:
+            entry[3] += 1
+            entry[4] += completed
+        lists[row.list_id][2] += 1
+        lists[row.list_id][3] += completed
+        open_items.append([row.path, row.id, (row.descendant_count, row.completed_descendant_count), 0, 0])
+    while open_items:
+        close(open_items.pop())
+
+    fixed_lists = [{'id': list_id, 'item_count': total, 'completed_count': completed}
+                   for list_id, (stored_total, stored_completed, total, completed) in lists.items()
+                   if (stored_total, stored_completed) != (total, completed)]
+
+    seq = bump_data_version(user_id) if fixed_lists or fixed_items else None
+    for model, rows in ((TodoList, fixed_lists), (TodoItem, fixed_items)):
+        for start in range(0, len(rows), 5000):
+            db.session.execute(db.update(model), [dict(row, change_seq=seq) for row in rows[start:start + 5000]])
+    db.session.commit()
+    return len(fixed_lists) + len(fixed_items)
+
+
+@app.cli.command('recount-progress')
+@click.option('--user', 'user_ids', type=int, multiple=True, help='ID of a user to repair (repeatable, default: all).')
+def recount_progress_command(user_ids):
+    """Recompute the progress counters of lists and items and fix wrong ones."""
+    fixed = 0
+    with write_transaction():
+        # Querying the users inside the block too, so the first user's transaction begins as a write
+        if not user_ids:
+            user_ids = [user_id for (user_id,) in db.session.query(TodoList.user_id).distinct()]
+        for user_id in user_ids:
+            fixed += recount_progress(user_id)  # One transaction per user, so writers aren't held up for long
+    click.echo(f'Fixed the counters of {fixed} lists and items.', err=True)
 
 
 @app.route('/todo')
@@ -336,6 +1993,8 @@ def home():
 # Main block to run the application
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()  # This will create the database and tables, it runs only when the script is executed directly
+        # Creating or updating the database through the migrations, so it's at the latest revision and later
+        # `flask db upgrade` runs start from there (create_all() would skip the search index and leave no revision)
+        upgrade(directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'))
 
     app.run(debug=True)  # Running the Flask application in debug mode
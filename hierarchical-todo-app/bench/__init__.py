@@ -0,0 +1,7 @@
+"""
+Reproducible benchmarks of the todo app: a seeded generator of synthetic
+data (generate.py), request scenarios (scenarios.py) and a runner that
+reports latency percentiles and SQL statements per request, plus the
+run's peak RSS, as JSON, optionally failing on regressions against a
+baseline (__main__.py).
+"""
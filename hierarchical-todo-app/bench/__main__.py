@@ -0,0 +1,104 @@
+"""
+Command line entry point, run from the app folder:
+
+    python -m bench --users 10 --lists 5 --depth 4 --fanout 4 --output results.json
+    python -m bench --baseline results.json --threshold 0.2
+
+Exits with status 1 when a scenario regressed past the threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m bench', description='Benchmark the todo app on synthetic data.')
+    parser.add_argument('--users', type=int, default=10, help='users to generate')
+    parser.add_argument('--lists', type=int, default=5, help='lists per user (at least 2)')
+    parser.add_argument('--depth', type=int, default=3, help='item levels per list')
+    parser.add_argument('--fanout', type=int, default=4, help='top-level items per list and sub-items per item')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generated data')
+    parser.add_argument('--repeat', type=int, default=50, help='requests per scenario (per thread for concurrent ones)')
+    parser.add_argument('--threads', type=int, default=4, help='threads of the concurrent scenarios')
+    parser.add_argument('--scenario', action='append', help='scenario to run (repeatable, default: all)')
+    parser.add_argument('--database', help='database URI to generate the data in (default: a temporary SQLite file)')
+    parser.add_argument('--output', help='file to write the JSON results to (default: stdout)')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative increase of p95 latency or statements per request that fails the run')
+    args = parser.parse_args()
+    if args.lists < 2:
+        parser.error('--lists must be at least 2 (subtree_move moves between two lists)')
+    return args
+
+
+def main():
+    args = parse_args()
+
+    # The app reads its database URI when it is imported, so this has to come first
+    temporary_folder = None
+    if args.database:
+        os.environ['DATABASE_URL'] = args.database
+    else:
+        temporary_folder = tempfile.TemporaryDirectory(prefix='todo-bench-')
+        os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(temporary_folder.name, "bench.db")}'
+
+    from flask_migrate import upgrade
+
+    from app import app, db
+    from bench.generate import generate
+    from bench.runner import Bench, compare, peak_rss_kb
+    from bench.scenarios import SCENARIOS
+
+    names = args.scenario or list(SCENARIOS)
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f'Unknown scenario(s): {", ".join(sorted(unknown))}. Available: {", ".join(SCENARIOS)}')
+
+    with app.app_context():
+        upgrade()  # Rather than create_all(), so the SQLite search index and its triggers exist too
+        dataset = generate(args.users, args.lists, args.depth, args.fanout, args.seed)
+
+    bench = Bench(args.repeat, args.threads)
+    results = {
+        'meta': {
+            'users': args.users, 'lists_per_user': args.lists, 'depth': args.depth, 'fanout': args.fanout,
+            'seed': args.seed, 'items': dataset['items'], 'repeat': args.repeat, 'threads': args.threads,
+            'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+        },
+        'scenarios': {},
+    }
+    for name in names:
+        results['scenarios'][name] = result = bench.run(SCENARIOS[name], dataset)
+        print(f'{name:20} p50 {result["p50_ms"]:9.3f} ms  p95 {result["p95_ms"]:9.3f} ms  '
+              f'p99 {result["p99_ms"]:9.3f} ms  {result["statements_per_request"]:6.2f} statements/request',
+              file=sys.stderr)
+
+    results['meta']['peak_rss_kb'] = peak_rss_kb()  # Of the whole run, including generating the data
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+    if temporary_folder:
+        with app.app_context():
+            db.engine.dispose()  # Closing the pooled connections before deleting the file
+        temporary_folder.cleanup()
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Seeded generator of synthetic users, lists and item trees.
+"""
+import random
+
+from app import db, User, TodoList, TodoItem, CountChanges, allocate_ids
+
+WORDS = ('buy', 'call', 'write', 'fix', 'plan', 'review', 'send', 'book', 'clean', 'read',
+         'milk', 'report', 'garden', 'invoice', 'tickets', 'slides', 'car', 'email', 'dentist', 'taxes')
+
+INSERT_CHUNK = 5000  # Rows per executemany
+
+
+def generate(users=10, lists_per_user=5, depth=3, fanout=4, seed=0, completed_ratio=0.3):
+    """
+    Insert users, their lists and full item trees straight into the app's
+    database, in one transaction. The same arguments always produce the same
+    rows, and new rows are added after whatever is already there.
+    Every list gets fanout top-level items, each with fanout sub-items, down
+    to depth levels, i.e. fanout + fanout**2 + ... + fanout**depth items.
+    Must be called inside an app context.
+    :param users: Number of users to create.
+    :param lists_per_user: Number of lists each user owns.
+    :param depth: Number of item levels in each list (1 for flat lists).
+    :param fanout: Number of top-level items per list and sub-items per item.
+    :param seed: Seed of the random contents and completion states.
+    :param completed_ratio: Share of items created completed.
+    :return: Dictionary of the created user IDs, each user's list IDs and each list's top-level item IDs.
+    """
+    rng = random.Random(seed)
+    dataset = {'users': [], 'lists': {}, 'roots': {}, 'items': 0}
+
+    user_rows = [{'id': user_id, 'username': f'bench-user-{user_id}', 'password': 'bench'}
+                 for user_id in allocate_ids(User, users)]
+    db.session.execute(db.insert(User.__table__), user_rows)
+
+    list_ids = iter(allocate_ids(TodoList, users * lists_per_user))
+    list_rows = []
+    for user in user_rows:
+        dataset['users'].append(user['id'])
+        dataset['lists'][user['id']] = []
+        for _ in range(lists_per_user):
+            list_id = next(list_ids)
+            list_rows.append({'id': list_id, 'title': f'List {list_id}', 'user_id': user['id']})
+            dataset['lists'][user['id']].append(list_id)
+
+    items_per_list = sum(fanout ** level for level in range(1, depth + 1))
+    item_ids = iter(allocate_ids(TodoItem, items_per_list * len(list_rows)))
+    item_rows = []
+    for todo_list in list_rows:
+        # Creating the tree level by level, so parents come before their sub-items
+        parents = [None]
+        for level in range(depth):
+            children = []
+            for parent in parents:
+                for _ in range(fanout):
+                    item_id = next(item_ids)
+                    item_rows.append({
+                        'id': item_id,
+                        'content': f'{rng.choice(WORDS)} {rng.choice(WORDS)} {item_id}',
+                        'list_id': todo_list['id'],
+                        'parent_id': parent['id'] if parent else None,
+                        'completed': rng.random() < completed_ratio,
+                        'path': (parent['path'] if parent else '/') + f'{item_id}/',
+                        'depth': level,
+                        'change_seq': 0,
+                    })
+                    children.append(item_rows[-1])
+            parents = children
+        dataset['roots'][todo_list['id']] = [row['id'] for row in item_rows[-items_per_list:]
+                                             if row['parent_id'] is None]
+
+    # Every list and item is new, so all of their progress counters go into the inserted rows
+    counts = CountChanges()
+    counts.add_new_items(item_rows, 0)
+    counts.fill_new_rows(list_rows, item_rows)
+
+    db.session.execute(db.insert(TodoList.__table__), list_rows)
+    for start in range(0, len(item_rows), INSERT_CHUNK):
+        db.session.execute(db.insert(TodoItem.__table__), item_rows[start:start + INSERT_CHUNK])
+    db.session.commit()
+
+    dataset['items'] = len(item_rows)
+    return dataset
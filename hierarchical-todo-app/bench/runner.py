@@ -0,0 +1,126 @@
+"""
+Runs the scenarios and measures latency, SQL statements and memory.
+"""
+import math
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+from app import app, db
+
+
+def percentile(values, percent):
+    """
+    Return the nearest-rank percentile of a list of numbers.
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def peak_rss_kb():
+    """
+    Return the peak resident set size of this process so far, in KiB,
+    or None where it can't be measured. It's the peak over the process's
+    whole life, so it's reported once per run rather than per scenario.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak  # macOS reports bytes, Linux KiB
+
+
+class Bench:
+    """
+    Runs scenarios against the Flask test client, recording the latency and
+    number of SQL statements of every request they make.
+    """
+
+    def __init__(self, repeat=50, threads=4):
+        self.repeat = repeat
+        self.threads = threads
+        self.samples = []  # (seconds, statements) per request of the running scenario
+        self.counters = threading.local()  # Statements of the request running on each thread
+        with app.app_context():
+            db.event.listen(db.engine, 'before_cursor_execute', self.count_statement)
+
+    def count_statement(self, connection, cursor, statement, parameters, context, executemany):
+        self.counters.statements = getattr(self.counters, 'statements', 0) + 1
+
+    def client(self, user_id):
+        """
+        Return a test client logged in as a user.
+        """
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+        return client
+
+    def request(self, client, method, url, json=None):
+        """
+        Send a request, record its latency and statement count and return the response.
+        """
+        self.counters.statements = 0
+        start = time.perf_counter()
+        response = client.open(url, method=method, json=json)
+        response.get_data()  # Including the time to stream the body
+        elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method} {url} returned {response.status_code}: {response.get_data(as_text=True)}')
+        self.samples.append((elapsed, self.counters.statements))
+        return response
+
+    def run(self, scenario, dataset):
+        """
+        Run a scenario once to warm up, then again to measure it.
+        :return: Dictionary of the scenario's latency percentiles and statements per request.
+        """
+        repeat, self.repeat = self.repeat, 1
+        scenario(self, dataset)
+        self.repeat = repeat
+
+        self.samples = []
+        start = time.perf_counter()
+        scenario(self, dataset)
+        duration = time.perf_counter() - start
+
+        latencies = [seconds * 1000 for seconds, _ in self.samples]
+        statements = [count for _, count in self.samples]
+        return {
+            'requests': len(self.samples),
+            'duration_s': round(duration, 3),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'statements_per_request': round(sum(statements) / len(statements), 2),
+            'max_statements': max(statements),
+        }
+
+
+# Metrics compared against the baseline; a higher value is a regression
+COMPARED_METRICS = ('p95_ms', 'statements_per_request')
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare benchmark results with a baseline run.
+    :param results: Results of this run, as written to the JSON output.
+    :param baseline: Results of the baseline run.
+    :param threshold: Allowed relative increase, e.g. 0.2 for 20%.
+    :return: A message for every metric of a scenario that regressed past the threshold.
+    """
+    regressions = []
+    for name, result in results['scenarios'].items():
+        base = baseline['scenarios'].get(name)
+        if base is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if result[metric] > base[metric] * (1 + threshold):
+                regressions.append(f'{name}: {metric} went from {base[metric]} to {result[metric]} '
+                                   f'(+{(result[metric] / base[metric] - 1) * 100 if base[metric] else math.inf:.0f}%)')
+    return regressions
@@ -0,0 +1,97 @@
+"""
+Benchmark scenarios. Each one sends its requests through bench.request(),
+which times them and counts their SQL statements, and repeats its work
+bench.repeat times.
+"""
+import threading
+
+from bench.generate import WORDS
+
+
+def tree_fetch(bench, dataset):
+    """Fetch a user's whole tree of lists and items, missing the response cache."""
+    client = bench.client(dataset['users'][0])
+    for n in range(bench.repeat):
+        # An unused query argument gives every request its own cache key
+        bench.request(client, 'GET', f'/get-todo-lists-items?limit=500&n={n}')
+
+
+def tree_fetch_cached(bench, dataset):
+    """Fetch a user's whole tree of lists and items from the response cache."""
+    client = bench.client(dataset['users'][0])
+    for _ in range(bench.repeat):
+        bench.request(client, 'GET', '/get-todo-lists-items?limit=500')
+
+
+def changes_fetch(bench, dataset):
+    """Fetch all of a user's lists and items through the delta-sync endpoint."""
+    client = bench.client(dataset['users'][0])
+    for _ in range(bench.repeat):
+        bench.request(client, 'GET', '/changes?since=0')
+
+
+def subtree_move(bench, dataset):
+    """Move a full-depth subtree back and forth between two of a user's lists."""
+    user_id = dataset['users'][0]
+    client = bench.client(user_id)
+    first_list, second_list = dataset['lists'][user_id][:2]
+    root_id = dataset['roots'][first_list][0]
+    for n in range(bench.repeat):
+        new_list_id = second_list if n % 2 == 0 else first_list
+        bench.request(client, 'PUT', f'/move-item/{root_id}', {'new_list_id': new_list_id})
+    if bench.repeat % 2:
+        client.put(f'/move-item/{root_id}', json={'new_list_id': first_list})  # Leaving the dataset as it was
+
+
+def bulk_complete(bench, dataset):
+    """Complete whole subtrees, a different top-level item each time."""
+    user_id = dataset['users'][0]
+    client = bench.client(user_id)
+    roots = [root_id for list_id in dataset['lists'][user_id] for root_id in dataset['roots'][list_id]]
+    for n in range(bench.repeat):
+        bench.request(client, 'PUT', f'/todoitem/{roots[n % len(roots)]}/complete')
+
+
+def search(bench, dataset):
+    """Search a user's items for a one-word prefix and a two-word query."""
+    client = bench.client(dataset['users'][0])
+    for n in range(bench.repeat):
+        query = WORDS[n % len(WORDS)][:3] if n % 2 == 0 else f'{WORDS[n % len(WORDS)]} {WORDS[(n * 7) % len(WORDS)]}'
+        bench.request(client, 'GET', f'/search?q={query}')
+
+
+def concurrent_writers(bench, dataset):
+    """Add items and rename lists from bench.threads threads at once, spread over the users."""
+    errors = []
+
+    def write(thread):
+        user_id = dataset['users'][thread % len(dataset['users'])]
+        client = bench.client(user_id)
+        list_id = dataset['lists'][user_id][thread // len(dataset['users']) % len(dataset['lists'][user_id])]
+        try:
+            for n in range(bench.repeat):
+                bench.request(client, 'POST', '/add-todo-item',
+                              {'content': f'written by thread {thread}', 'list_id': list_id, 'parent_id': None})
+                bench.request(client, 'PUT', f'/update-todo-list/{list_id}', {'title': f'List {list_id} ({n})'})
+        except Exception as error:  # Re-raised below, as a thread's exceptions would otherwise only be printed
+            errors.append(error)
+
+    threads = [threading.Thread(target=write, args=(thread,)) for thread in range(bench.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+# Scenarios in the order they are run
+SCENARIOS = {
+    'tree_fetch': tree_fetch,
+    'tree_fetch_cached': tree_fetch_cached,
+    'changes_fetch': changes_fetch,
+    'subtree_move': subtree_move,
+    'bulk_complete': bulk_complete,
+    'search': search,
+    'concurrent_writers': concurrent_writers,
+}
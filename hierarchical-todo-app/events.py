@@ -0,0 +1,233 @@
+"""
+Publish/subscribe brokers that carry change events to the /events streams.
+
+LocalBroker delivers events to subscribers in the same process. HubBroker
+relays them through a small hub process (started with `flask event-hub`),
+so every worker process sees the events published by all the others.
+Hub connections are authenticated with a shared key and carry each event as
+one JSON frame; nothing received from the network is unpickled.
+"""
+import json
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+
+class LocalBroker:
+    """
+    In-process broker. The last events of each user are kept, ordered by ID,
+    in a bounded ring buffer, so a client that reconnects with Last-Event-ID
+    can be sent whatever it missed. Event IDs are the user's data versions,
+    which go up by exactly one per committed transaction.
+    """
+
+    def __init__(self, buffer_size=100):
+        self.buffer_size = buffer_size
+        self.buffers = {}  # User ID -> list of (event ID, data), oldest first
+        self.condition = threading.Condition()
+
+    def publish(self, user_id, event_id, data):
+        """
+        Publish an event to every subscriber of a user.
+        :param user_id: ID of the user the event is for.
+        :param event_id: The user's data version after the change.
+        :param data: JSON-serializable event payload.
+        """
+        self.deliver(user_id, event_id, data)
+
+    def deliver(self, user_id, event_id, data):
+        """
+        Add an event to the user's buffer and wake up their subscribers.
+        Transactions can commit in one order and publish in another, so the
+        event is inserted at its place by ID rather than appended.
+        """
+        with self.condition:
+            buffer = self.buffers.setdefault(user_id, [])
+            position = len(buffer)
+            while position and buffer[position - 1][0] >= event_id:
+                if buffer[position - 1][0] == event_id:
+                    return  # Already delivered, e.g. both locally and through the hub
+                position -= 1
+            buffer.insert(position, (event_id, data))
+            del buffer[:-self.buffer_size]  # Dropping the oldest events once the buffer is full
+            self.condition.notify_all()
+
+    def latest_event_id(self, user_id):
+        """
+        Return the ID of the newest buffered event of a user, or 0 if there is none.
+        """
+        with self.condition:
+            buffer = self.buffers.get(user_id)
+            return buffer[-1][0] if buffer else 0
+
+    def wait_for_events(self, user_id, last_event_id, timeout):
+        """
+        Wait up to timeout seconds for the events that follow last_event_id.
+        Returns them in order (an empty list if nothing happened), or None when
+        the next event can't be delivered any more, because it has dropped out
+        of the buffer or later events arrived without it. The client then has
+        to catch up through /changes instead.
+        :param user_id: ID of the subscribed user.
+        :param last_event_id: ID of the last event the client has seen.
+        :param timeout: Longest time to wait, in seconds.
+        """
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                buffer = self.buffers.get(user_id, [])
+                events = []
+                for event in buffer:
+                    if event[0] == last_event_id + len(events) + 1:
+                        events.append(event)
+                    elif event[0] > last_event_id + len(events) + 1:
+                        break  # A hole: the next event hasn't arrived (yet)
+                if events:
+                    return events
+
+                missed = bool(buffer) and buffer[-1][0] > last_event_id
+                if missed and buffer[0][0] > last_event_id + 1:
+                    return None  # The next event is older than anything still buffered
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None if missed else []
+                self.condition.wait(remaining)
+
+
+class HubBroker(LocalBroker):
+    """
+    Broker that sends every event to a hub process, which relays it to the
+    brokers of all worker processes. While the hub can't be reached, events
+    are still delivered to this process's own subscribers.
+    """
+
+    def __init__(self, address, authkey, buffer_size=100):
+        super().__init__(buffer_size)
+        self.address = address
+        self.authkey = authkey
+        self.connection = None
+        self.send_lock = threading.Lock()
+        threading.Thread(target=self.read_from_hub, daemon=True).start()
+
+    def publish(self, user_id, event_id, data):
+        with self.send_lock:
+            if self.connection is not None:
+                try:
+                    self.connection.send_bytes(json.dumps([user_id, event_id, data]).encode())
+                    return
+                except (OSError, EOFError):
+                    self.connection = None
+        self.deliver(user_id, event_id, data)
+
+    def read_from_hub(self):
+        """
+        Keep a connection to the hub open, delivering every event it relays.
+        """
+        while True:
+            try:
+                connection = Client(self.address, authkey=self.authkey)
+            except (OSError, AuthenticationError):
+                time.sleep(1)  # Retrying until the hub is up
+                continue
+
+            with self.send_lock:
+                self.connection = connection
+            try:
+                while True:
+                    self.deliver(*json.loads(connection.recv_bytes()))
+            except (OSError, EOFError):
+                pass
+            with self.send_lock:
+                self.connection = None
+            connection.close()
+
+
+def run_hub(address, authkey):
+    """
+    Run the event hub: each event sent by a worker is relayed to every
+    connected worker, the sender included. Frames are relayed as they are,
+    without being decoded. Blocks forever.
+    :param address: (host, port) to listen on.
+    :param authkey: Shared secret the workers authenticate with.
+    """
+    if not authkey:
+        raise ValueError('The event hub needs a shared authkey.')
+    listener = Listener(address, authkey=authkey)
+    workers = []
+    lock = threading.Lock()
+
+    def relay(connection):
+        try:
+            while True:
+                message = connection.recv_bytes()
+                with lock:
+                    for worker in list(workers):
+                        try:
+                            worker.send_bytes(message)
+                        except (OSError, EOFError):
+                            workers.remove(worker)
+        except (OSError, EOFError):
+            pass
+        with lock:
+            if connection in workers:
+                workers.remove(connection)
+        connection.close()
+
+    while True:
+        try:
+            connection = listener.accept()
+        except (OSError, EOFError, AuthenticationError):
+            continue  # A client that failed to authenticate or hung up
+        with lock:
+            workers.append(connection)
+        threading.Thread(target=relay, args=(connection,), daemon=True).start()
+
+
+def parse_hub_url(url):
+    """
+    Turn a 'hub://host:port' URL into a (host, port) address.
+    """
+    host, _, port = url[len('hub://'):].rpartition(':')
+    return host, int(port)
+
+
+def make_broker(url, authkey, buffer_size=100):
+    """
+    Create the broker configured by EVENT_BROKER_URL: None for a LocalBroker,
+    or 'hub://host:port' for a HubBroker, which needs an authkey.
+    """
+    if not url:
+        return LocalBroker(buffer_size)
+    if url.startswith('hub://'):
+        if not authkey:
+            raise ValueError('An EVENT_BROKER_URL hub needs EVENT_HUB_AUTHKEY to be set.')
+        return HubBroker(parse_hub_url(url), authkey, buffer_size)
+    raise ValueError(f'Unsupported EVENT_BROKER_URL: {url}')
+
+
+class StreamLimiter:
+    """
+    Counts the open event streams of each user and refuses new ones above a limit.
+    """
+
+    def __init__(self, max_streams):
+        self.max_streams = max_streams
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, user_id):
+        """
+        Reserve a stream for a user. Returns False if they already have the maximum.
+        """
+        with self.lock:
+            if self.counts.get(user_id, 0) >= self.max_streams:
+                return False
+            self.counts[user_id] = self.counts.get(user_id, 0) + 1
+            return True
+
+    def release(self, user_id):
+        with self.lock:
+            self.counts[user_id] -= 1
+            if not self.counts[user_id]:
+                del self.counts[user_id]
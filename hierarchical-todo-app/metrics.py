@@ -0,0 +1,218 @@
+"""
+Request and SQL instrumentation: per-endpoint latency histograms, SQL
+statements, database time and rows per request, a Prometheus text endpoint
+at /metrics and an N+1 query detector.
+
+Request counts and latencies are recorded for every request. The SQL
+details are only collected for a sampled share of requests
+(METRICS_SAMPLE_RATE), which keeps the overhead low enough to leave on.
+Metrics are kept per process; with several workers, scrape each of them.
+"""
+import bisect
+import random
+import threading
+import time
+from collections import Counter
+
+from flask import Response, g, has_app_context, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # Seconds
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    """
+    Prometheus-style histogram: a count per bucket upper bound, plus the sum
+    and count of all observed values.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one counts values above every bound
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        """
+        Yield the histogram's lines in the Prometheus text format, with cumulative buckets.
+        """
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class RequestStats:
+    """
+    SQL activity of one sampled request.
+    """
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.statement_counts = Counter()  # Parameterized SQL -> times executed
+
+
+class Metrics:
+    """
+    Thread-safe store of the metrics of this process, keyed by endpoint.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter()  # (endpoint, method, status) -> requests
+        self.latency = {}  # Endpoint -> Histogram of seconds
+        self.sampled = Counter()  # Endpoint -> sampled requests
+        self.statements = {}  # Endpoint -> Histogram of statements per sampled request
+        self.db_seconds = Counter()  # Endpoint -> seconds spent executing SQL in sampled requests
+        self.rows = Counter()  # Endpoint -> rows returned or changed in sampled requests
+        self.n_plus_one = Counter()  # Endpoint -> sampled requests flagged as N+1
+
+    def record(self, endpoint, method, status, seconds, stats, n_plus_one):
+        with self.lock:
+            self.requests[endpoint, method, status] += 1
+            self.latency.setdefault(endpoint, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            if stats is not None:
+                self.sampled[endpoint] += 1
+                self.statements.setdefault(endpoint, Histogram(STATEMENT_BUCKETS)).observe(stats.statements)
+                self.db_seconds[endpoint] += stats.db_seconds
+                self.rows[endpoint] += stats.rows
+                if n_plus_one:
+                    self.n_plus_one[endpoint] += 1
+
+    def render(self):
+        """
+        Return every metric in the Prometheus text exposition format.
+        """
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        with self.lock:
+            family('todo_http_requests_total', 'counter', 'Requests handled, by endpoint, method and status.')
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'todo_http_requests_total{{endpoint="{endpoint}",method="{method}",'
+                             f'status="{status}"}} {count}')
+
+            family('todo_http_request_duration_seconds', 'histogram',
+                   'Time to handle a request, until its response is returned.')
+            for endpoint, histogram in sorted(self.latency.items()):
+                lines.extend(histogram.samples('todo_http_request_duration_seconds', f'endpoint="{endpoint}"'))
+
+            family('todo_sampled_requests_total', 'counter', 'Requests whose SQL activity was recorded.')
+            for endpoint, count in sorted(self.sampled.items()):
+                lines.append(f'todo_sampled_requests_total{{endpoint="{endpoint}"}} {count}')
+
+            family('todo_db_statements_per_request', 'histogram', 'SQL statements executed by a sampled request.')
+            for endpoint, histogram in sorted(self.statements.items()):
+                lines.extend(histogram.samples('todo_db_statements_per_request', f'endpoint="{endpoint}"'))
+
+            family('todo_db_seconds_total', 'counter', 'Time spent executing SQL in sampled requests.')
+            for endpoint, seconds in sorted(self.db_seconds.items()):
+                lines.append(f'todo_db_seconds_total{{endpoint="{endpoint}"}} {seconds:.6f}')
+
+            family('todo_db_rows_total', 'counter', 'Rows returned or changed by SQL in sampled requests.')
+            for endpoint, rows in sorted(self.rows.items()):
+                lines.append(f'todo_db_rows_total{{endpoint="{endpoint}"}} {rows}')
+
+            family('todo_n_plus_one_requests_total', 'counter',
+                   'Sampled requests that repeated one SQL statement more than METRICS_N_PLUS_ONE_THRESHOLD times.')
+            for endpoint, count in sorted(self.n_plus_one.items()):
+                lines.append(f'todo_n_plus_one_requests_total{{endpoint="{endpoint}"}} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def current_stats():
+    """
+    Return the SQL stats of the running request if it is sampled, else None.
+    """
+    return g.get('request_stats') if has_app_context() else None
+
+
+def init_instrumentation(app, db):
+    """
+    Instrument the app's requests and its database engine, and add the
+    /metrics endpoint.
+    :param app: The Flask application.
+    :param db: Its Flask-SQLAlchemy extension.
+    :return: The Metrics of this process.
+    """
+    app.config.setdefault('METRICS_SAMPLE_RATE', 0.1)
+    app.config.setdefault('METRICS_N_PLUS_ONE_THRESHOLD', 10)
+    metrics = Metrics()
+
+    @app.before_request
+    def start_request():
+        g.request_start = time.perf_counter()
+        if random.random() < app.config['METRICS_SAMPLE_RATE']:
+            g.request_stats = RequestStats()
+
+    @app.after_request
+    def finish_request(response):
+        seconds = time.perf_counter() - g.pop('request_start', time.perf_counter())
+        stats = g.pop('request_stats', None)
+        endpoint = request.endpoint or 'unmatched'  # Not the URL, which would make a label per item ID
+
+        n_plus_one = False
+        if stats is not None and stats.statement_counts:
+            statement, count = stats.statement_counts.most_common(1)[0]
+            if count > app.config['METRICS_N_PLUS_ONE_THRESHOLD']:
+                n_plus_one = True
+                app.logger.warning('Possible N+1 queries in %s %s: %d executions of %s',
+                                   request.method, request.path, count, ' '.join(statement.split())[:200])
+
+        metrics.record(endpoint, request.method, response.status_code, seconds, stats, n_plus_one)
+        return response
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_statement(connection, cursor, statement, parameters, context, executemany):
+        if current_stats() is not None:
+            connection.info.setdefault('statement_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def finish_statement(connection, cursor, statement, parameters, context, executemany):
+        stats = current_stats()
+        if stats is None or not connection.info.get('statement_start'):
+            return
+        stats.db_seconds += time.perf_counter() - connection.info['statement_start'].pop()
+        stats.statements += 1
+        stats.statement_counts[statement] += 1
+        if not cursor.description and cursor.rowcount > 0:
+            stats.rows += cursor.rowcount  # Rows changed; returned rows are counted as they're fetched below
+
+    @event.listens_for(db.session, 'do_orm_execute')
+    def count_returned_rows(orm_execute_state):
+        stats = current_stats()
+        if stats is None or not orm_execute_state.is_select:
+            return None  # Executing the statement as usual
+        if orm_execute_state.execution_options.get('yield_per'):
+            return None  # Streamed results are left alone, rather than loaded into memory to count them
+
+        result = orm_execute_state.invoke_statement()
+        frozen = result.freeze()  # Fetching the rows to count them, then handing out a copy
+        stats.rows += len(frozen.data)
+        return frozen()
+
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        """
+        Return this process's metrics in the Prometheus text format.
+        """
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    return metrics
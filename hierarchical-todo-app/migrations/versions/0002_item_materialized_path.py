@@ -0,0 +1,60 @@
+"""materialized path for todo item hierarchy
+
+Revision ID: 0002_item_materialized_path
+Revises: 0001_initial_schema
+Create Date: 2026-10-18 09:40:27.553019
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_item_materialized_path'
+down_revision = '0001_initial_schema'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('todo_item', schema=None) as batch_op:
+        # Byte-wise comparisons keep subtrees contiguous ranges of paths, whatever the database's default collation
+        batch_op.add_column(sa.Column('path', sa.Text().with_variant(sa.Text(collation='C'), 'postgresql'),
+                                      nullable=True))
+        batch_op.add_column(sa.Column('depth', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index(batch_op.f('ix_todo_item_path'), ['path'], unique=False)
+
+    # Items whose parent was deleted before subtree deletes existed become top-level items
+    op.execute("""
+        UPDATE todo_item SET parent_id = NULL
+        WHERE parent_id IS NOT NULL AND parent_id NOT IN (SELECT id FROM todo_item)
+    """)
+
+    # Walking the existing adjacency list once to compute every path, depth and the
+    # list each subtree belongs to (moves used to leave sub-items in the old list)
+    op.execute("""
+        CREATE TEMPORARY TABLE item_paths AS
+        WITH RECURSIVE tree(id, list_id, path, depth) AS (
+            SELECT id, list_id, '/' || id || '/', 0 FROM todo_item WHERE parent_id IS NULL
+            UNION ALL
+            SELECT child.id, tree.list_id, tree.path || child.id || '/', tree.depth + 1
+            FROM todo_item AS child JOIN tree ON child.parent_id = tree.id
+        )
+        SELECT id, list_id, path, depth FROM tree
+    """)
+    op.execute("CREATE INDEX ix_item_paths_id ON item_paths (id)")
+    op.execute("""
+        UPDATE todo_item SET
+            path = (SELECT path FROM item_paths WHERE item_paths.id = todo_item.id),
+            depth = (SELECT depth FROM item_paths WHERE item_paths.id = todo_item.id),
+            list_id = (SELECT list_id FROM item_paths WHERE item_paths.id = todo_item.id)
+        WHERE id IN (SELECT id FROM item_paths)
+    """)
+    op.execute("DROP TABLE item_paths")
+
+
+def downgrade():
+    with op.batch_alter_table('todo_item', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_todo_item_path'))
+        batch_op.drop_column('depth')
+        batch_op.drop_column('path')
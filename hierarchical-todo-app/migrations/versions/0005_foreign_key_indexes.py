@@ -0,0 +1,28 @@
+"""indexes on foreign keys
+
+Revision ID: 0005_foreign_key_indexes
+Revises: 0004_change_seq_and_tombstones
+Create Date: 2026-10-18 14:02:41.318560
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_foreign_key_indexes'
+down_revision = '0004_change_seq_and_tombstones'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Plain CREATE INDEX rather than batch mode, so SQLite doesn't copy the tables
+    op.create_index(op.f('ix_todo_list_user_id'), 'todo_list', ['user_id'], unique=False)
+    op.create_index(op.f('ix_todo_item_list_id'), 'todo_item', ['list_id'], unique=False)
+    op.create_index(op.f('ix_todo_item_parent_id'), 'todo_item', ['parent_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_todo_item_parent_id'), table_name='todo_item')
+    op.drop_index(op.f('ix_todo_item_list_id'), table_name='todo_item')
+    op.drop_index(op.f('ix_todo_list_user_id'), table_name='todo_list')
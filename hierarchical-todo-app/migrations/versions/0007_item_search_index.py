@@ -0,0 +1,60 @@
+"""full-text search index on todo item content
+
+Revision ID: 0007_item_search_index
+Revises: 0006_import_jobs
+Create Date: 2026-10-18 16:05:33.281946
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0007_item_search_index'
+down_revision = '0006_import_jobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # FTS5 is SQLite only; on other databases /search falls back to LIKE queries
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    # An external content table: the index stores only the tokens and reads
+    # contents back from todo_item, so item text isn't stored twice.
+    # prefix='2 3' adds indexes that make short prefix queries fast.
+    op.execute("""
+        CREATE VIRTUAL TABLE todo_item_fts USING fts5(
+            content, content='todo_item', content_rowid='id', tokenize='unicode61', prefix='2 3'
+        )
+    """)
+    op.execute("INSERT INTO todo_item_fts(todo_item_fts) VALUES ('rebuild')")  # Indexing the existing items
+
+    # Keeping the index in sync with every insert, delete and change of content
+    op.execute("""
+        CREATE TRIGGER todo_item_fts_insert AFTER INSERT ON todo_item BEGIN
+            INSERT INTO todo_item_fts(rowid, content) VALUES (new.id, new.content);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER todo_item_fts_delete AFTER DELETE ON todo_item BEGIN
+            INSERT INTO todo_item_fts(todo_item_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+    """)
+    # Only content changes touch the index, so completing and moving items don't
+    op.execute("""
+        CREATE TRIGGER todo_item_fts_update AFTER UPDATE OF content ON todo_item BEGIN
+            INSERT INTO todo_item_fts(todo_item_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO todo_item_fts(rowid, content) VALUES (new.id, new.content);
+        END
+    """)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute("DROP TRIGGER todo_item_fts_update")
+    op.execute("DROP TRIGGER todo_item_fts_delete")
+    op.execute("DROP TRIGGER todo_item_fts_insert")
+    op.execute("DROP TABLE todo_item_fts")
@@ -0,0 +1,63 @@
+"""progress counters on lists and items
+
+Revision ID: 0008_progress_counters
+Revises: 0007_item_search_index
+Create Date: 2026-10-18 17:42:09.518302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008_progress_counters'
+down_revision = '0007_item_search_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('todo_item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('descendant_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('completed_descendant_count', sa.Integer(), server_default='0',
+                                      nullable=False))
+
+    with op.batch_alter_table('todo_list', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('item_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('completed_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Counting the existing items once; from here on the app keeps the counters up to date.
+    # A subtree is the range of paths between its root's path and the same path ending in '0' instead of '/'
+    # (path compares byte by byte: SQLite's default collation, and "C" on PostgreSQL since migration 0002)
+    op.execute("""
+        UPDATE todo_item SET
+            descendant_count = (
+                SELECT count(*) FROM todo_item AS descendant
+                WHERE descendant.path > todo_item.path
+                AND descendant.path < substr(todo_item.path, 1, length(todo_item.path) - 1) || '0'
+            ),
+            completed_descendant_count = (
+                SELECT count(*) FROM todo_item AS descendant
+                WHERE descendant.path > todo_item.path
+                AND descendant.path < substr(todo_item.path, 1, length(todo_item.path) - 1) || '0'
+                AND descendant.completed
+            )
+    """)
+    op.execute("""
+        UPDATE todo_list SET
+            item_count = (SELECT count(*) FROM todo_item WHERE todo_item.list_id = todo_list.id),
+            completed_count = (
+                SELECT count(*) FROM todo_item WHERE todo_item.list_id = todo_list.id AND todo_item.completed
+            )
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('todo_list', schema=None) as batch_op:
+        batch_op.drop_column('completed_count')
+        batch_op.drop_column('item_count')
+
+    # Dropping the columns in place: recreating todo_item would drop the search index's triggers with it
+    with op.batch_alter_table('todo_item', schema=None, recreate='never') as batch_op:
+        batch_op.drop_column('completed_descendant_count')
+        batch_op.drop_column('descendant_count')
@@ -0,0 +1,110 @@
+"""owner token in the full-text search index
+
+Revision ID: 0009_search_index_owner
+Revises: 0008_progress_counters
+Create Date: 2026-10-18 21:14:52.604117
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0009_search_index_owner'
+down_revision = '0008_progress_counters'
+branch_labels = None
+depends_on = None
+
+
+def drop_search_index():
+    op.execute("DROP TRIGGER todo_item_fts_update")
+    op.execute("DROP TRIGGER todo_item_fts_delete")
+    op.execute("DROP TRIGGER todo_item_fts_insert")
+    op.execute("DROP TABLE todo_item_fts")
+
+
+def upgrade():
+    # The index only exists on SQLite, see migration 0007
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    drop_search_index()
+
+    # The index now stores each item's content together with an owner token ('u' and the user ID),
+    # and searches match the token along with the words, so FTS5 only ranks the user's own items.
+    # The owner comes from the item's list, which todo_item has no column for, so the content is
+    # kept in the index itself rather than read back from todo_item as an external content table.
+    op.execute("""
+        CREATE VIRTUAL TABLE todo_item_fts USING fts5(
+            content, owner, tokenize='unicode61', prefix='2 3'
+        )
+    """)
+    op.execute("""
+        INSERT INTO todo_item_fts(rowid, content, owner)
+        SELECT todo_item.id, todo_item.content, 'u' || todo_list.user_id
+        FROM todo_item JOIN todo_list ON todo_list.id = todo_item.list_id
+    """)
+
+    # Keeping the index in sync with every insert, delete, change of content and change of owner
+    op.execute("""
+        CREATE TRIGGER todo_item_fts_insert AFTER INSERT ON todo_item BEGIN
+            INSERT INTO todo_item_fts(rowid, content, owner)
+            VALUES (new.id, new.content, 'u' || (SELECT user_id FROM todo_list WHERE id = new.list_id));
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER todo_item_fts_delete AFTER DELETE ON todo_item BEGIN
+            DELETE FROM todo_item_fts WHERE rowid = old.id;
+        END
+    """)
+    # Completing items and moving them between lists of the same user don't touch the index
+    op.execute("""
+        CREATE TRIGGER todo_item_fts_update AFTER UPDATE OF content, list_id ON todo_item
+        WHEN old.content IS NOT new.content
+            OR (SELECT user_id FROM todo_list WHERE id = old.list_id)
+            IS NOT (SELECT user_id FROM todo_list WHERE id = new.list_id)
+        BEGIN
+            UPDATE todo_item_fts
+            SET content = new.content, owner = 'u' || (SELECT user_id FROM todo_list WHERE id = new.list_id)
+            WHERE rowid = new.id;
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER todo_list_fts_owner AFTER UPDATE OF user_id ON todo_list
+        WHEN old.user_id IS NOT new.user_id
+        BEGIN
+            UPDATE todo_item_fts SET owner = 'u' || new.user_id
+            WHERE rowid IN (SELECT id FROM todo_item WHERE list_id = new.id);
+        END
+    """)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute("DROP TRIGGER todo_list_fts_owner")
+    drop_search_index()
+
+    # Back to the external content index of migration 0007
+    op.execute("""
+        CREATE VIRTUAL TABLE todo_item_fts USING fts5(
+            content, content='todo_item', content_rowid='id', tokenize='unicode61', prefix='2 3'
+        )
+    """)
+    op.execute("INSERT INTO todo_item_fts(todo_item_fts) VALUES ('rebuild')")
+    op.execute("""
+        CREATE TRIGGER todo_item_fts_insert AFTER INSERT ON todo_item BEGIN
+            INSERT INTO todo_item_fts(rowid, content) VALUES (new.id, new.content);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER todo_item_fts_delete AFTER DELETE ON todo_item BEGIN
+            INSERT INTO todo_item_fts(todo_item_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER todo_item_fts_update AFTER UPDATE OF content ON todo_item BEGIN
+            INSERT INTO todo_item_fts(todo_item_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO todo_item_fts(rowid, content) VALUES (new.id, new.content);
+        END
+    """)
@@ -1,58 +1,200 @@
+// ETag and data of the latest GET response of each path, so polling /changes?since=N keeps one entry
+// rather than one per sequence number
+var responseCache = {};
+
 // Function to send AJAX requests
 function sendAjaxRequest(method, url, data, successCallback) {
     var xhr = new XMLHttpRequest();
     xhr.open(method, url, true);
     xhr.setRequestHeader('Content-Type', 'application/json');
+    // Asking the server to answer with 304 Not Modified if our copy is still current
+    var path = url.split('?')[0];
+    var cached = method === 'GET' && responseCache[path] && responseCache[path].url === url ? responseCache[path] : null;
+    if (cached) {
+        xhr.setRequestHeader('If-None-Match', cached.etag);
+    }
     xhr.onreadystatechange = function () {
-        if (xhr.readyState === 4 && xhr.status === 200) {
-            successCallback(JSON.parse(xhr.responseText));
+        if (xhr.readyState !== 4) {
+            return;
+        }
+        if (xhr.status === 304 && cached) {
+            successCallback(cached.data);
+        } else if (xhr.status >= 200 && xhr.status < 300) {
+            var responseData = JSON.parse(xhr.responseText);
+            var etag = xhr.getResponseHeader('ETag');
+            if (method === 'GET' && etag) {
+                responseCache[path] = { url: url, etag: etag, data: responseData };
+            }
+            successCallback(responseData);
         }
     };
     xhr.send(JSON.stringify(data));
 }
 
-// Modify the fetchTodoListsAndItems function to accept an activeListId parameter
-function fetchTodoListsAndItems(activeListId = null) {
-    sendAjaxRequest('GET', '/get-todo-lists-items', {}, function (response) {
-        displayTodoListsAndItems(response, activeListId);
+// Local copy of the user's lists and items, kept up to date from /changes
+var todoState = {
+    seq: 0,     // Change sequence the local copy is up to date with (0 loads everything)
+    lists: {},  // List ID -> {id, title}
+    items: {}   // Item ID -> {id, list_id, parent_id, content, completed}
+};
+
+// Function to fetch only what changed since the last sync and patch the page with it
+function syncChanges() {
+    sendAjaxRequest('GET', `/changes?since=${todoState.seq}`, {}, function (changes) {
+        applyChanges(changes);
     });
 }
 
-function displayTodoListsAndItems(lists, activeListId) {
-    // Populating the dropdown
-    var activeListDropdown = document.getElementById('active-list');
-    activeListDropdown.innerHTML = ''; // Clearing the dropdown
+// Server-Sent Events stream pushing every change to the user's data, in any tab or device
+var eventSource = null;
 
-    lists.forEach(function (list) {
-        var option = document.createElement('option');
-        option.value = list.id;
-        option.textContent = list.title;
-        // Set the selected attribute if this is the active list
-        if (list.id == activeListId) {
-            option.selected = true;
+// Function to subscribe to change events once the local copy is loaded
+function listenForChanges() {
+    if (!window.EventSource || eventSource) {
+        return;
+    }
+    // The browser resumes from the last event ID by itself when it reconnects
+    eventSource = new EventSource(`/events?since=${todoState.seq}`);
+    eventSource.addEventListener('change', function (event) {
+        var changes = JSON.parse(event.data);
+        if (changes.seq <= todoState.seq) {
+            return; // Already applied, e.g. through syncChanges()
         }
-        activeListDropdown.appendChild(option);
+        if (changes.resync || changes.seq !== todoState.seq + 1) {
+            syncChanges(); // Too big to send, or we missed an earlier change
+        } else {
+            applyChanges(changes);
+        }
+    });
+    eventSource.addEventListener('resync', function () {
+        syncChanges(); // The server no longer has the changes we missed
     });
+}
+
+// Function called after our own writes: their changes arrive as events,
+// so we only fetch them ourselves while there is no event stream
+function syncAfterWrite() {
+    if (!eventSource || eventSource.readyState === EventSource.CLOSED) {
+        syncChanges();
+    }
+}
+
+function getActiveListId() {
+    return document.getElementById('active-list').value;
+}
+
+function applyChanges(changes) {
+    var previousListId = getActiveListId();
+
+    // Applying deletions before the changed rows, in case a deleted ID was reused
+    changes.deleted.lists.forEach(function (listId) {
+        delete todoState.lists[listId];
+        var option = document.querySelector(`#active-list option[value="${listId}"]`);
+        if (option) {
+            option.remove();
+        }
+    });
+    changes.deleted.items.forEach(function (itemId) {
+        delete todoState.items[itemId];
+        var itemElement = document.getElementById(`item-${itemId}`);
+        if (itemElement) {
+            itemElement.remove();
+        }
+    });
+
+    changes.lists.forEach(function (list) {
+        todoState.lists[list.id] = list;
+        renderListOption(list);
+    });
+
+    if (getActiveListId() !== previousListId) {
+        // A different list is showing now (e.g. the first sync, or the active list was deleted)
+        changes.items.forEach(function (item) {
+            todoState.items[item.id] = item;
+        });
+        renderActiveList();
+    } else {
+        // Items arrive parents first, so each item's parent is already on the page
+        changes.items.forEach(function (item) {
+            todoState.items[item.id] = item;
+            renderItem(item);
+        });
+    }
+
+    todoState.seq = Math.max(todoState.seq, changes.seq);
+}
+
+function renderListOption(list) {
+    var activeListDropdown = document.getElementById('active-list');
+    var option = activeListDropdown.querySelector(`option[value="${list.id}"]`);
+    if (!option) {
+        option = document.createElement('option');
+        option.value = list.id;
+        activeListDropdown.appendChild(option);
+    }
+    // The counters come with the list, so showing progress doesn't need its items
+    option.textContent = list.item_count
+        ? `${list.title} (${list.completed_count} of ${list.item_count} done)`
+        : list.title;
+}
+
+// Function to add, update or move the element of a single item
+function renderItem(item) {
+    var itemElement = document.getElementById(`item-${item.id}`);
+    if (item.list_id != getActiveListId()) { // Only the active list's items are shown
+        if (itemElement) {
+            itemElement.remove();
+        }
+        return;
+    }
 
-    // Displaying the todo lists and items
+    if (!itemElement) {
+        itemElement = document.createElement('div');
+        itemElement.className = 'todo-item';
+        itemElement.id = `item-${item.id}`;
+        itemElement.innerHTML = `
+            <p></p>
+            <span class="progress"></span>
+            <button onclick="deleteTodo(${item.id}, true)">Delete</button>
+            <button onclick="markAsComplete(${item.id})">Complete</button>
+            <div class="sub-items"></div>
+        `;
+    }
+    itemElement.querySelector('p').textContent = item.content;
+    itemElement.querySelector('.progress').textContent = item.descendant_count
+        ? `${item.completed_descendant_count} of ${item.descendant_count} sub-items done`
+        : '';
+    itemElement.classList.toggle('completed', Boolean(item.completed));
+
+    var container = item.parent_id
+        ? document.querySelector(`#item-${item.parent_id} > .sub-items`)
+        : document.getElementById('items-container');
+    if (container && itemElement.parentNode !== container) {
+        container.appendChild(itemElement);
+    }
+}
+
+// Function to draw the active list's items from the local copy, without asking the server
+function renderActiveList() {
     var itemsContainer = document.getElementById('items-container');
     itemsContainer.innerHTML = ''; // Clearing the container
 
-    // Use the provided activeListId to determine which items to display
-    lists.forEach(function (list) {
-        if (list.id == activeListId) { // Displaying items for the selected list
-            list.items.forEach(function (item) {
-                var itemElement = document.createElement('div');
-                itemElement.className = 'todo-item';
-                itemElement.innerHTML = `
-                    <p>${item.content}</p>
-                    <button onclick="deleteTodo(${item.id}, true)">Delete</button>
-                    <button onclick="markAsComplete(${item.id})">Complete</button>
-                `;
-                itemsContainer.appendChild(itemElement);
-            });
+    var activeListId = getActiveListId();
+    var subItems = {}; // Parent ID ('top' for top-level items) -> items
+    Object.values(todoState.items).forEach(function (item) {
+        if (item.list_id == activeListId) {
+            var parentKey = item.parent_id || 'top';
+            (subItems[parentKey] = subItems[parentKey] || []).push(item);
         }
     });
+
+    function renderSubItems(parentKey) {
+        (subItems[parentKey] || []).sort(function (a, b) { return a.id - b.id; }).forEach(function (item) {
+            renderItem(item);
+            renderSubItems(item.id);
+        });
+    }
+    renderSubItems('top');
 }
 
 
@@ -62,7 +204,7 @@ function addTodoList() {
     
     var newListTitle = document.getElementById('new-list-title').value;
     sendAjaxRequest('POST', '/add-todo-list', { title: newListTitle, user_id: userId }, function (response) {
-        fetchTodoListsAndItems();
+        syncAfterWrite();
     });
 }
 
@@ -72,7 +214,7 @@ function addTodoList() {
 function addTodoItem(listId, parentId = null) {
     var newItemContent = document.getElementById('new-todo').value;
     sendAjaxRequest('POST', '/add-todo-item', { content: newItemContent, list_id: listId, parent_id: parentId }, function (response) {
-        fetchTodoListsAndItems();
+        syncAfterWrite();
     });
 }
 
@@ -80,7 +222,7 @@ function addTodoItem(listId, parentId = null) {
 function updateTodo(id, content, isItem = true) {
     var url = isItem ? `/update-todo-item/${id}` : `/update-todo-list/${id}`;
     sendAjaxRequest('PUT', url, { content: content }, function (response) {
-        fetchTodoListsAndItems();
+        syncAfterWrite();
     });
 }
 
@@ -88,21 +230,21 @@ function updateTodo(id, content, isItem = true) {
 function deleteTodo(id, isItem = true) {
     var url = isItem ? `/delete-todo-item/${id}` : `/delete-todo-list/${id}`;
     sendAjaxRequest('DELETE', url, {}, function (response) {
-        fetchTodoListsAndItems();
+        syncAfterWrite();
     });
 }
 
 // Function to mark a todo item as complete
 function markAsComplete(itemId) {
-    sendAjaxRequest('PUT', `/mark-as-complete/${itemId}`, {}, function (response) {
-        fetchTodoListsAndItems();
+    sendAjaxRequest('PUT', `/todoitem/${itemId}/complete`, {}, function (response) {
+        syncAfterWrite();
     });
 }
 
 // Function to move a todo item to a different list
 function moveItem(itemId, newListId) {
     sendAjaxRequest('PUT', `/move-item/${itemId}`, { new_list_id: newListId }, function (response) {
-        fetchTodoListsAndItems();
+        syncAfterWrite();
     });
 }
 
@@ -111,7 +253,7 @@ document.getElementById('create-list').addEventListener('click', function() {
     var title = prompt("Enter the title of the new list:");
     if (title) {
         sendAjaxRequest('POST', '/todolist', { title: title }, function(response) {
-            fetchTodoListsAndItems();
+            syncAfterWrite();
         });
     }
 });
@@ -122,7 +264,7 @@ document.getElementById('edit-list').addEventListener('click', function() {
     var newTitle = prompt("Enter the new title of the list:");
     if (newTitle) {
         sendAjaxRequest('PUT', `/update-todo-list/${listId}`, { title: newTitle }, function(response) {
-            fetchTodoListsAndItems();
+            syncAfterWrite();
         });
     }
 });
@@ -133,18 +275,11 @@ document.getElementById('delete-list').addEventListener('click', function() {
     var confirmation = confirm("Are you sure you want to delete this list?");
     if (confirmation) {
         sendAjaxRequest('DELETE', `/delete-todo-list/${listId}`, {}, function(response) {
-            fetchTodoListsAndItems();
+            syncAfterWrite();
         });
     }
 });
 
-window.onload = function() {
-    document.getElementById('active-list').addEventListener('click', function() {
-        fetchTodoListsAndItems();
-    });
-};
-
-
 document.addEventListener('DOMContentLoaded', function() {
     // Attach event listener to the form
     var form = document.getElementById('add-item-form');
@@ -167,8 +302,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
 // Function to handle changing of the active list
 function onActiveListChange() {
-    var activeListId = document.getElementById('active-list').value;
-    fetchTodoListsAndItems(activeListId); // Fetch and display items for the selected list
+    renderActiveList(); // The items are already here, so there is nothing to fetch
 }
 
 // Attach the change event listener to the dropdown
@@ -176,6 +310,11 @@ document.addEventListener('DOMContentLoaded', function() {
     var activeListDropdown = document.getElementById('active-list');
     if (activeListDropdown) {
         activeListDropdown.addEventListener('change', onActiveListChange);
+        // Loading everything once, then letting the server push what changes
+        sendAjaxRequest('GET', '/changes?since=0', {}, function (changes) {
+            applyChanges(changes);
+            listenForChanges();
+        });
     } else {
         console.error('Dropdown with ID "active-list" was not found.');
     }
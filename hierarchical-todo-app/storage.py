@@ -0,0 +1,108 @@
+"""
+Database connection settings that let several worker processes share one
+SQLite file. Server databases (any other DATABASE_URL) are left untouched.
+"""
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import has_request_context, request
+from sqlalchemy import event
+
+
+DEFAULT_DATABASE_URI = 'sqlite:///site.db'
+
+# Applied to every new SQLite connection; override any of them with app.config['SQLITE_PRAGMAS']
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',  # Readers keep reading while a writer commits
+    'busy_timeout': 5000,  # Milliseconds to wait for another process's write lock instead of failing
+    'synchronous': 'NORMAL',  # Durable enough with WAL, and far fewer fsyncs than FULL
+    'mmap_size': 256 * 1024 * 1024,  # Reading pages through a 256 MB memory map
+    'cache_size': -64000,  # 64 MB page cache per connection (negative values are KiB)
+}
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Set by write_transaction() for writes made outside of a request, e.g. by CLI commands
+writing = ContextVar('writing', default=False)
+
+
+def database_uri():
+    """
+    Return the database URI from the DATABASE_URL environment variable,
+    defaulting to the SQLite file in the instance folder.
+    """
+    return os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URI)
+
+
+@contextmanager
+def write_transaction():
+    """
+    Mark the transactions begun inside the block as writes, so that they take
+    the write lock up front like those of POST/PUT/DELETE requests.
+    """
+    token = writing.set(True)
+    try:
+        yield
+    finally:
+        writing.reset(token)
+
+
+def is_write():
+    """
+    Tell whether a transaction being begun is going to write.
+    """
+    if writing.get():
+        return True
+    return has_request_context() and request.method not in READ_METHODS
+
+
+def configure_storage(app, db):
+    """
+    Set up the SQLite connections of the app's engine: apply the pragmas to
+    every pooled connection, and begin write transactions with BEGIN IMMEDIATE
+    behind a per-process lock, so writers queue for the write lock instead of
+    failing with "database is locked" while readers carry on.
+    Does nothing when the app uses another database.
+    :param app: The Flask application.
+    :param db: Its Flask-SQLAlchemy extension.
+    """
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = {**SQLITE_PRAGMAS, **app.config.get('SQLITE_PRAGMAS', {})}
+    write_lock = threading.Lock()  # One writer at a time within this process
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        # Taking over transaction control from the sqlite3 module, which would
+        # otherwise only begin a (deferred) transaction at the first write
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def begin(connection):
+        if is_write():
+            # Waiting here rather than in SQLite's busy handler, which polls with sleeps
+            acquired = write_lock.acquire(timeout=pragmas['busy_timeout'] / 1000)
+            try:
+                connection.exec_driver_sql('BEGIN IMMEDIATE')
+            except Exception:
+                if acquired:
+                    write_lock.release()
+                raise
+            connection.info['holds_write_lock'] = acquired
+        else:
+            connection.exec_driver_sql('BEGIN')
+
+    @event.listens_for(engine, 'commit')
+    @event.listens_for(engine, 'rollback')
+    def release_write_lock(connection):
+        if connection.info.pop('holds_write_lock', False):
+            write_lock.release()
@@ -0,0 +1,63 @@
+"""
+Shared fixtures. The app reads DATABASE_URL when it is imported, so the
+tests' database is chosen here, before any test module imports the app.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+APP_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_FOLDER)
+
+database_folder = tempfile.TemporaryDirectory(prefix='todo-tests-')
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(database_folder.name, "test.db")}'
+
+from flask_migrate import upgrade  # noqa: E402
+
+from app import app, db, User  # noqa: E402
+
+
+@pytest.fixture(scope='session', autouse=True)
+def database():
+    """
+    Build the tests' database through the migrations, like a real deployment.
+    """
+    with app.app_context():
+        upgrade(directory=os.path.join(APP_FOLDER, 'migrations'))
+    yield
+    with app.app_context():
+        db.engine.dispose()  # Closing the pooled connections before deleting the file
+    database_folder.cleanup()
+
+
+def create_user():
+    """
+    Create a user and return their ID.
+    """
+    with app.app_context():
+        user = User(username=f'tester-{User.query.count() + 1}', password='password')
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def logged_in_client(user_id):
+    """
+    Return a test client logged in as a user.
+    """
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+    return client
+
+
+@pytest.fixture
+def user_id():
+    return create_user()
+
+
+@pytest.fixture
+def client(user_id):
+    return logged_in_client(user_id)
@@ -0,0 +1,33 @@
+"""
+Checks of GET /todoitem/<id>/ancestors.
+"""
+from app import app, TodoItem
+from conftest import create_user, logged_in_client
+from workload import owned_ids
+
+
+def test_ancestors_are_listed_root_first(client, user_id):
+    client.post('/todolist', json={'title': 'list'})
+    (list_id,), _ = owned_ids(user_id)
+    results = client.post('/batch', json=[
+        {'op': 'create', 'content': 'root', 'list_id': list_id, 'temp_id': 'a'},
+        {'op': 'create', 'content': 'middle', 'parent_id': 'a', 'temp_id': 'b'},
+        {'op': 'create', 'content': 'leaf', 'parent_id': 'b'},
+    ]).get_json()['results']
+
+    response = client.get(f'/todoitem/{results[2]["id"]}/ancestors').get_json()
+
+    assert response['depth'] == 2
+    assert [item['content'] for item in response['ancestors']] == ['root', 'middle']
+
+
+def test_ancestors_need_the_items_owner(client, user_id):
+    client.post('/todolist', json={'title': 'list'})
+    (list_id,), _ = owned_ids(user_id)
+    client.post('/add-todo-item', json={'content': 'private', 'list_id': list_id})
+    with app.app_context():
+        item_id = TodoItem.query.filter_by(list_id=list_id).one().id
+
+    assert app.test_client().get(f'/todoitem/{item_id}/ancestors').status_code == 401
+    assert logged_in_client(create_user()).get(f'/todoitem/{item_id}/ancestors').status_code == 404
+    assert client.get(f'/todoitem/{item_id}/ancestors').status_code == 200
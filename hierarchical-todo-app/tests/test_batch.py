@@ -0,0 +1,42 @@
+"""
+Checks of POST /batch: temp_id references resolve to the created items and
+a failing operation rolls back the whole batch.
+"""
+from app import app, TodoItem
+from workload import assert_counters_exact, owned_ids
+
+
+def test_batch_resolves_temp_ids(client, user_id):
+    client.post('/todolist', json={'title': 'list'})
+    (list_id,), _ = owned_ids(user_id)
+
+    response = client.post('/batch', json=[
+        {'op': 'create', 'content': 'parent', 'list_id': list_id, 'temp_id': 'a'},
+        {'op': 'create', 'content': 'child', 'parent_id': 'a', 'temp_id': 'b'},
+        {'op': 'complete', 'id': 'b'},
+    ])
+
+    assert response.status_code == 200
+    parent, child, _ = response.get_json()['results']
+    assert (parent['temp_id'], child['temp_id']) == ('a', 'b')
+    with app.app_context():
+        child_item = TodoItem.query.get(child['id'])
+        assert child_item.parent_id == parent['id']
+        assert child_item.completed
+    assert_counters_exact(user_id)
+
+
+def test_failed_batch_changes_nothing(client, user_id):
+    client.post('/todolist', json={'title': 'list'})
+    (list_id,), _ = owned_ids(user_id)
+    before = client.get('/changes?since=0').get_json()
+
+    response = client.post('/batch', json=[
+        {'op': 'create', 'content': 'kept?', 'list_id': list_id, 'temp_id': 'a'},
+        {'op': 'create', 'content': 'child', 'parent_id': 'a'},
+        {'op': 'delete', 'id': 10 ** 9},  # Missing, so the whole batch is rolled back
+    ])
+
+    assert response.status_code == 404
+    assert response.get_json()['index'] == 2
+    assert client.get('/changes?since=0').get_json() == before
@@ -0,0 +1,61 @@
+"""
+Checks of the read endpoints' ETags and per-user response cache.
+"""
+import app as todo_app
+from conftest import create_user, logged_in_client
+from workload import owned_ids
+
+
+def count_loads(monkeypatch):
+    """
+    Count the calls of load_todo_tree, which only runs on a cache miss.
+    """
+    calls = []
+
+    def load_todo_tree(user_id, *page):
+        calls.append(user_id)
+        return original(user_id, *page)
+
+    original = todo_app.load_todo_tree
+    monkeypatch.setattr(todo_app, 'load_todo_tree', load_todo_tree)
+    return calls
+
+
+def test_current_etag_gets_an_empty_304(client):
+    client.post('/todolist', json={'title': 'list'})
+    response = client.get('/get-todo-lists-items')
+
+    revalidated = client.get('/get-todo-lists-items', headers={'If-None-Match': response.headers['ETag']})
+
+    assert revalidated.status_code == 304
+    assert revalidated.get_data() == b''
+    assert revalidated.headers['ETag'] == response.headers['ETag']
+
+
+def test_cache_hits_skip_loading(client, monkeypatch):
+    client.post('/todolist', json={'title': 'list'})
+    loads = count_loads(monkeypatch)
+
+    first = client.get('/get-todo-lists-items')
+    second = client.get('/get-todo-lists-items')
+    client.get('/get-todo-lists-items?limit=1')  # Another page is another entry
+
+    assert second.get_data() == first.get_data()
+    assert len(loads) == 2
+
+
+def test_writes_and_other_users_miss_the_cache(client, user_id, monkeypatch):
+    client.post('/todolist', json={'title': 'list'})
+    (list_id,), _ = owned_ids(user_id)
+    loads = count_loads(monkeypatch)
+    first = client.get('/get-todo-lists-items')
+
+    client.post('/add-todo-item', json={'content': 'item', 'list_id': list_id})
+    second = client.get('/get-todo-lists-items')
+    other_user_id = create_user()
+    other = logged_in_client(other_user_id).get('/get-todo-lists-items')
+
+    assert loads == [user_id, user_id, other_user_id]
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert [item['content'] for item in second.get_json()[0]['items']] == ['item']
+    assert other.get_json() == []
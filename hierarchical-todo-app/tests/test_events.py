@@ -0,0 +1,137 @@
+"""
+Checks of the change event brokers, the hub, and the /events stream's
+replay from Last-Event-ID.
+"""
+import socket
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+import pytest
+
+from app import app, db, get_broker, User
+from events import LocalBroker, make_broker, run_hub
+from workload import owned_ids
+
+
+def read_events(response, count):
+    """
+    Read the next count Server-Sent Events from a streamed response, skipping comments.
+    """
+    events = []
+    chunks = iter(response.response)
+    while len(events) < count:
+        chunk = next(chunks)
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if not chunk.startswith((':', 'retry:')):
+            fields = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+            events.append((int(fields['id']), fields['event']))
+    return events
+
+
+def test_broker_delivers_events_in_order():
+    broker = LocalBroker()
+    broker.publish(1, 2, 'second')
+    broker.publish(1, 1, 'first')  # Published after a later transaction, but delivered in order
+    broker.publish(1, 1, 'first')  # Delivered twice, e.g. locally and through the hub
+
+    assert broker.wait_for_events(1, 0, timeout=0) == [(1, 'first'), (2, 'second')]
+    assert broker.wait_for_events(1, 2, timeout=0) == []
+    assert broker.wait_for_events(2, 0, timeout=0) == []  # Other users' events are kept apart
+
+
+def test_broker_waits_for_a_hole_to_be_filled():
+    broker = LocalBroker()
+    broker.publish(1, 1, 'first')
+    broker.publish(1, 3, 'third')
+
+    assert broker.wait_for_events(1, 0, timeout=0) == [(1, 'first')]
+    assert broker.wait_for_events(1, 1, timeout=0) is None  # Event 2 never arrived
+
+    threading.Timer(0.05, broker.publish, (1, 2, 'second')).start()
+    assert broker.wait_for_events(1, 1, timeout=5) == [(2, 'second'), (3, 'third')]
+
+
+def test_broker_reports_events_dropped_from_the_buffer():
+    broker = LocalBroker(buffer_size=3)
+    for event_id in range(1, 6):
+        broker.publish(1, event_id, event_id)
+
+    assert broker.wait_for_events(1, 1, timeout=5) is None  # Returned at once, 2 is gone for good
+    assert broker.wait_for_events(1, 2, timeout=0) == [(3, 3), (4, 4), (5, 5)]
+    assert broker.latest_event_id(1) == 5
+
+
+def test_stream_replays_from_last_event_id(client, user_id):
+    client.post('/todolist', json={'title': 'list'})
+    (list_id,), _ = owned_ids(user_id)
+    seq = client.get('/changes?since=0').get_json()['seq']
+    for n in range(2):
+        client.post('/add-todo-item', json={'content': f'item {n}', 'list_id': list_id})
+
+    response = client.get('/events', headers={'Last-Event-ID': str(seq)})
+    try:
+        assert read_events(response, 2) == [(seq + 1, 'change'), (seq + 2, 'change')]
+    finally:
+        response.close()
+
+
+def test_stream_resyncs_when_the_missed_events_are_gone(client, user_id):
+    broker = get_broker()
+    broker.buffer_size, buffer_size = 1, broker.buffer_size
+    try:
+        client.post('/todolist', json={'title': 'list'})
+        (list_id,), _ = owned_ids(user_id)
+        for n in range(3):
+            client.post('/add-todo-item', json={'content': f'item {n}', 'list_id': list_id})
+    finally:
+        broker.buffer_size = buffer_size
+    seq = client.get('/changes?since=0').get_json()['seq']
+
+    response = client.get('/events', headers={'Last-Event-ID': str(seq - 2)})
+    try:
+        assert read_events(response, 1) == [(seq, 'resync')]
+    finally:
+        response.close()
+
+
+def test_hub_relays_json_frames_between_brokers():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        address = probe.getsockname()
+    threading.Thread(target=run_hub, args=(address, b'secret'), daemon=True).start()
+
+    with pytest.raises(ValueError):
+        make_broker(f'hub://{address[0]}:{address[1]}', b'')
+    deadline = time.monotonic() + 10
+    while True:  # Clients with the wrong key are turned away without stopping the hub
+        try:
+            Client(address, authkey=b'wrong')
+        except AuthenticationError:
+            break
+        except OSError:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+
+    brokers = [make_broker(f'hub://{address[0]}:{address[1]}', b'secret') for _ in range(2)]
+    while any(broker.connection is None for broker in brokers):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+    brokers[0].publish(1, 1, {'seq': 1, 'items': []})
+    assert brokers[1].wait_for_events(1, 0, timeout=5) == [(1, {'seq': 1, 'items': []})]
+
+
+def test_idle_stream_resyncs_after_unpublished_writes(client, user_id):
+    seq = client.get('/changes?since=0').get_json()['seq']
+    app.config['EVENT_HEARTBEAT_SECONDS'], heartbeat = 0.05, app.config['EVENT_HEARTBEAT_SECONDS']
+    response = client.get('/events', headers={'Last-Event-ID': str(seq)})
+    try:
+        with app.app_context():  # A write by another worker, whose event never reaches this one
+            db.session.execute(db.update(User).where(User.id == user_id).values(data_version=seq + 1))
+            db.session.commit()
+        assert read_events(response, 1) == [(seq + 1, 'resync')]
+    finally:
+        response.close()
+        app.config['EVENT_HEARTBEAT_SECONDS'] = heartbeat
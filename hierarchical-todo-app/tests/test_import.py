@@ -0,0 +1,67 @@
+"""
+Checks of POST /import: a job resumed after a failed chunk ends up with
+the same lists and items as the input.
+"""
+import json
+
+from app import app, ImportIdMap, TodoItem, TodoList
+from conftest import create_user, logged_in_client
+from workload import assert_counters_exact, owned_ids
+
+
+def without_ids(data):
+    """
+    Drop the IDs from JSON data, which differ between an export and its import.
+    """
+    if isinstance(data, list):
+        return [without_ids(value) for value in data]
+    if isinstance(data, dict):
+        return {key: without_ids(value) for key, value in data.items() if key != 'id'}
+    return data
+
+
+def test_resumed_import_matches_the_input(client, user_id):
+    lines = [json.dumps({'type': 'list', 'id': 'L', 'title': 'imported'})]
+    for n in range(40):
+        parent_id = f'i{n // 3}' if n >= 3 else None  # Every item past the first three has a parent
+        lines.append(json.dumps({'type': 'item', 'id': f'i{n}', 'list_id': 'L', 'parent_id': parent_id,
+                                 'content': f'item {n}', 'completed': n % 4 == 0}))
+    broken = lines[:]
+    broken[25] = '{not json'
+
+    app.config['IMPORT_CHUNK_SIZE'], chunk_size = 7, app.config['IMPORT_CHUNK_SIZE']
+    try:
+        failed = client.post('/import', data='\n'.join(broken)).get_json()
+        assert failed['status'] == 'failed'
+        assert failed['lines_done'] == 21  # The three chunks before the broken line were kept
+        done = client.post(f'/import?job={failed["id"]}', data='\n'.join(lines)).get_json()
+    finally:
+        app.config['IMPORT_CHUNK_SIZE'] = chunk_size
+
+    assert done['status'] == 'done'
+    assert done['items_imported'] == 40
+    with app.app_context():
+        items = {item.content: item for item in TodoItem.query.join(TodoList, TodoItem.list_id == TodoList.id)
+                 .filter(TodoList.user_id == user_id)}
+        assert len(items) == 40
+        for n in range(3, 40):
+            assert items[f'item {n}'].parent_id == items[f'item {n // 3}'].id
+        assert ImportIdMap.query.filter_by(job_id=done['id']).count() == 0
+    assert_counters_exact(user_id)
+
+
+def test_export_imports_into_an_equal_tree(client, user_id):
+    client.post('/todolist', json={'title': 'list'})
+    (list_id,), _ = owned_ids(user_id)
+    client.post('/batch', json=[
+        {'op': 'create', 'content': 'parent', 'list_id': list_id, 'temp_id': 'a'},
+        {'op': 'create', 'content': 'child', 'parent_id': 'a', 'temp_id': 'b', 'completed': True},
+        {'op': 'create', 'content': 'grandchild', 'parent_id': 'b'},
+    ])
+
+    other_client = logged_in_client(create_user())
+    done = other_client.post('/import', data=client.get('/export').get_data()).get_json()
+
+    assert done['status'] == 'done'
+    assert without_ids(other_client.get('/get-todo-lists-items').get_json()) == \
+        without_ids(client.get('/get-todo-lists-items').get_json())
@@ -0,0 +1,102 @@
+"""
+Checks of the keyset pagination of /get-todo-items and /get-todo-lists-items:
+following the Link headers visits every list and item exactly once.
+"""
+import json
+
+import pytest
+
+from workload import owned_ids
+
+
+def fill_lists(client, user_id):
+    """
+    Create lists holding 5, 0, 3 and 1 top-level items, most with a sub-item.
+    """
+    for title in ('a', 'b', 'c', 'd'):
+        client.post('/todolist', json={'title': title})
+    list_ids, _ = owned_ids(user_id)
+    operations = []
+    for list_id, count in zip(sorted(list_ids), (5, 0, 3, 1)):
+        for n in range(count):
+            operations.append({'op': 'create', 'content': f'{list_id}.{n}', 'list_id': list_id,
+                               'temp_id': f'{list_id}.{n}'})
+            if n % 2 == 0:
+                operations.append({'op': 'create', 'content': f'{list_id}.{n} sub', 'parent_id': f'{list_id}.{n}'})
+    client.post('/batch', json=operations)
+
+
+def follow_pages(client, url):
+    """
+    Fetch a page and every page its Link headers lead to.
+    :return: The pages' JSON data, in order.
+    """
+    pages = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        pages.append(response.get_json())
+        link = response.headers.get('Link')
+        url = link[link.index('<') + 1:link.index('>')] if link else None
+        assert not link or link.endswith('; rel="next"')
+    return pages
+
+
+def merge_pages(pages):
+    """
+    Join pages back into one response, the way a client would: a list sent
+    on several pages gets the items of each.
+    """
+    lists = {}
+    for page in pages:
+        for list_data in page:
+            if list_data['id'] in lists:
+                lists[list_data['id']]['items'] += list_data['items']
+            else:
+                lists[list_data['id']] = list_data
+    return list(lists.values())
+
+
+@pytest.mark.parametrize('endpoint', ['/get-todo-items', '/get-todo-lists-items'])
+@pytest.mark.parametrize('limit', [1, 2, 3, 500])
+def test_pages_add_up_to_the_whole(client, user_id, endpoint, limit):
+    fill_lists(client, user_id)
+
+    pages = follow_pages(client, f'{endpoint}?limit={limit}')
+
+    assert merge_pages(pages) == client.get(endpoint).get_json()
+    for previous, page in zip(pages, pages[1:]):
+        if page[0]['id'] == previous[-1]['id']:
+            assert page[0]['items']  # A list is only repeated with more of its items
+
+
+def test_item_pages_hold_limit_items(client, user_id):
+    fill_lists(client, user_id)
+
+    pages = follow_pages(client, '/get-todo-items?limit=4')
+
+    sizes = [sum(len(list_data['items']) for list_data in page) for page in pages]
+    assert sizes[:-1] == [4] * (len(pages) - 1)
+    assert sum(sizes) == 5 + 3 + 3 + 2 + 1 + 1  # Top-level items plus sub-items of each list
+    assert [list_data['title'] for list_data in pages[0]] == ['a']
+
+
+def test_tree_pages_hold_limit_top_level_items(client, user_id):
+    fill_lists(client, user_id)
+
+    pages = follow_pages(client, '/get-todo-lists-items?limit=2')
+
+    assert [[len(list_data['items']) for list_data in page] for page in pages] == \
+        [[2], [2], [1, 0, 1], [2], [1]]
+    assert all(item['sub_items'] for item in pages[0][0]['items'][::2])
+
+
+def test_streams_are_paged_by_list(client, user_id):
+    fill_lists(client, user_id)
+    list_ids = sorted(owned_ids(user_id)[0])
+
+    lines = client.get(f'/get-todo-items?stream=1&limit=2&after_list={list_ids[0]}').get_data(as_text=True)
+
+    rows = [json.loads(line) for line in lines.splitlines()]
+    assert [row['id'] for row in rows if row['type'] == 'list'] == list_ids[1:3]
+    assert {row['list_id'] for row in rows if row['type'] == 'item'} == {list_ids[2]}
@@ -0,0 +1,27 @@
+"""
+Checks that the progress counters kept by the write paths match a full
+recount.
+"""
+import pytest
+
+from workload import assert_counters_exact, owned_ids, random_writes
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_random_writes_keep_counters_exact(seed):
+    for step, client, user_ids in random_writes(seed, 150):
+        if step % 25 == 24:
+            assert_counters_exact(*user_ids)
+    assert_counters_exact(*user_ids)
+
+
+def test_counters_are_served_with_the_items(client, user_id):
+    client.post('/todolist', json={'title': 'list'})
+    (list_id,), _ = owned_ids(user_id)
+    client.post('/batch', json=[{'op': 'create', 'content': 'parent', 'list_id': list_id, 'temp_id': 'p'}] + [
+        {'op': 'create', 'content': f'child {n}', 'parent_id': 'p', 'completed': n == 0} for n in range(3)])
+
+    (todo_list,) = client.get('/get-todo-lists-items').get_json()
+    assert (todo_list['item_count'], todo_list['completed_count'], todo_list['open_count']) == (4, 1, 3)
+    (item,) = todo_list['items']
+    assert (item['descendant_count'], item['completed_descendant_count'], item['open_descendant_count']) == (3, 1, 2)
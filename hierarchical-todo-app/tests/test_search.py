@@ -0,0 +1,58 @@
+"""
+Checks of GET /search: hits are the user's own items, ranked and
+highlighted through the FTS5 index, which follows content and owner changes.
+"""
+from app import app, db, search_index_available, TodoList
+from conftest import create_user, logged_in_client
+from workload import owned_ids
+
+
+def search(client, query):
+    return client.get('/search', query_string={'q': query}).get_json()['results']
+
+
+def test_search_is_scoped_to_the_user(client, user_id):
+    other_user_id = create_user()
+    other_client = logged_in_client(other_user_id)
+    for owner_client, owner_id in ((client, user_id), (other_client, other_user_id)):
+        owner_client.post('/todolist', json={'title': 'groceries'})
+        (list_id,), _ = owned_ids(owner_id)
+        owner_client.post('/batch', json=[{'op': 'create', 'content': f'buy milk {n}', 'list_id': list_id}
+                                          for n in range(5)])
+
+    with app.app_context():
+        assert search_index_available()
+    hits = search(client, 'bu mil')
+
+    assert len(hits) == 5
+    assert {hit['list_id'] for hit in hits} == set(owned_ids(user_id)[0])
+    assert all('<mark>buy</mark> <mark>milk</mark>' in hit['snippet'] for hit in hits)
+
+
+def test_index_follows_content_and_owner(client, user_id):
+    other_user_id = create_user()
+    other_client = logged_in_client(other_user_id)
+    other_client.post('/todolist', json={'title': 'theirs'})
+    (other_list_id,), _ = owned_ids(other_user_id)
+    client.post('/todolist', json={'title': 'mine'})
+    (list_id,), _ = owned_ids(user_id)
+    first, second, _ = client.post('/batch', json=[
+        {'op': 'create', 'content': 'paint the fence', 'list_id': list_id, 'temp_id': 'a'},
+        {'op': 'create', 'content': 'paint the door', 'parent_id': 'a'},
+        {'op': 'create', 'content': 'paint the shed', 'list_id': list_id},
+    ]).get_json()['results']
+
+    client.put(f'/update-todo-item/{second["id"]}', json={'content': 'sand the door', 'completed': False})
+    assert [hit['content'] for hit in search(client, 'sand')] == ['sand the door']
+    assert len(search(client, 'paint')) == 2
+
+    client.put(f'/move-item/{first["id"]}', json={'new_list_id': other_list_id})  # Moves the sub-item along
+    assert [hit['content'] for hit in search(client, 'paint')] == ['paint the shed']
+    assert search(client, 'sand') == []
+    assert {hit['content'] for hit in search(other_client, 'the')} == {'paint the fence', 'sand the door'}
+
+    with app.app_context():  # Lists don't change owner through the API, but the index would follow
+        db.session.execute(db.update(TodoList).where(TodoList.id == list_id).values(user_id=other_user_id))
+        db.session.commit()
+    assert search(client, 'shed') == []
+    assert [hit['content'] for hit in search(other_client, 'shed')] == ['paint the shed']
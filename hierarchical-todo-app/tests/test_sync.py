@@ -0,0 +1,50 @@
+"""
+Checks that replaying /changes deltas, tombstones included, rebuilds the
+same lists and items as a full load.
+"""
+import pytest
+
+from workload import owned_ids, random_writes
+
+
+def apply_changes(state, changes):
+    """
+    Patch a client's copy of the data with a /changes delta, the way static/app.js does.
+    """
+    for list_id in changes['deleted']['lists']:
+        state['lists'].pop(list_id, None)
+    for item_id in changes['deleted']['items']:
+        state['items'].pop(item_id, None)
+    state['lists'].update((row['id'], row) for row in changes['lists'])
+    state['items'].update((row['id'], row) for row in changes['items'])
+    state['seq'] = changes['seq']
+
+
+def full_state(client):
+    changes = client.get('/changes?since=0').get_json()
+    return {'lists': {row['id']: row for row in changes['lists']},
+            'items': {row['id']: row for row in changes['items']}}
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_random_writes_keep_deltas_exact(seed):
+    state = {'seq': 0, 'lists': {}, 'items': {}}
+    for step, client, _ in random_writes(seed, 150):
+        apply_changes(state, client.get(f'/changes?since={state["seq"]}').get_json())
+        expected = full_state(client)
+        assert state['lists'] == expected['lists'], f'step {step}'
+        assert state['items'] == expected['items'], f'step {step}'
+
+
+def test_unchanged_data_is_not_sent_again(client, user_id):
+    client.post('/todolist', json={'title': 'list'})
+    response = client.get('/changes?since=0')
+    etag = response.headers['ETag']
+
+    assert client.get('/changes?since=0', headers={'If-None-Match': etag}).status_code == 304
+
+    (list_id,), _ = owned_ids(user_id)
+    client.post('/add-todo-item', json={'content': 'item', 'list_id': list_id})
+    changed = client.get(f'/changes?since={response.get_json()["seq"]}', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert [item['content'] for item in changed.get_json()['items']] == ['item']
@@ -0,0 +1,67 @@
+"""
+Checks that /get-todo-lists-items and /get-todo-items serve the same lists and
+items as the original per-object serializers, plus the progress counters.
+"""
+import pytest
+
+from app import app, TodoList
+from workload import random_writes
+
+COUNTER_KEYS = {'item_count', 'completed_count', 'open_count',
+                'descendant_count', 'completed_descendant_count', 'open_descendant_count'}
+
+
+def get_sub_items(sub_items):
+    """
+    The recursive serializer /get-todo-lists-items used before the tree was
+    loaded in one query, walking the ORM relationships one level at a time.
+    """
+    items = []
+    for item in sub_items:
+        items.append({
+            'id': item.id,
+            'content': item.content,
+            'completed': item.completed,
+            'sub_items': get_sub_items(item.sub_items)
+        })
+    return items
+
+
+def old_responses(user_id):
+    """
+    Build what the original /get-todo-lists-items and /get-todo-items returned for a user.
+    """
+    with app.app_context():
+        todo_lists = TodoList.query.filter_by(user_id=user_id).order_by(TodoList.id).all()
+        tree = [{'id': todo_list.id,
+                 'title': todo_list.title,
+                 'items': get_sub_items(item for item in todo_list.items if not item.parent_id)}
+                for todo_list in todo_lists]
+        flat = [{'id': todo_list.id,
+                 'title': todo_list.title,
+                 'items': [{'id': item.id, 'content': item.content, 'completed': item.completed}
+                           for item in todo_list.items]}
+                for todo_list in todo_lists]
+    return normalized(tree), normalized(flat)
+
+
+def normalized(data):
+    """
+    Drop the progress counters and sort the items by ID; the original
+    responses didn't order sibling items.
+    """
+    if isinstance(data, list):
+        return sorted((normalized(value) for value in data), key=lambda value: value.get('id'))
+    if isinstance(data, dict):
+        return {key: normalized(value) for key, value in data.items() if key not in COUNTER_KEYS}
+    return data
+
+
+@pytest.mark.parametrize('seed', range(2))
+def test_responses_match_the_recursive_serializer(seed):
+    for _, client, (user_id, _) in random_writes(seed, 60):
+        pass
+
+    tree, flat = old_responses(user_id)
+    assert normalized(client.get('/get-todo-lists-items').get_json()) == tree
+    assert normalized(client.get('/get-todo-items').get_json()) == flat
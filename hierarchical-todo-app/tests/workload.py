@@ -0,0 +1,100 @@
+"""
+Random write workloads shared by the randomized tests.
+"""
+import random
+
+from app import app, db, TodoItem, TodoList, recount_progress
+from conftest import create_user, logged_in_client
+
+
+def owned_ids(user_id):
+    """
+    Return the IDs of a user's lists and of the items in them.
+    """
+    with app.app_context():
+        list_ids = [list_id for (list_id,) in db.session.query(TodoList.id).filter_by(user_id=user_id)]
+        item_ids = [item_id for (item_id,) in db.session.query(TodoItem.id)
+                    .join(TodoList, TodoItem.list_id == TodoList.id).filter(TodoList.user_id == user_id)]
+    return list_ids, item_ids
+
+
+def random_batch(rng, list_ids, item_ids):
+    """
+    Build a /batch of random operations, some referring to items created earlier in it.
+    """
+    operations = []
+    for n in range(rng.randint(1, 8)):
+        kind = rng.choice(['create', 'create', 'sub-create', 'update', 'complete', 'move', 'delete'])
+        temp_ids = [operation['temp_id'] for operation in operations if 'temp_id' in operation]
+        if kind == 'create':
+            operations.append({'op': 'create', 'content': f'batch {n}', 'list_id': rng.choice(list_ids),
+                               'temp_id': f't{n}', 'completed': rng.random() < 0.4})
+        elif kind == 'sub-create' and (temp_ids or item_ids):
+            operations.append({'op': 'create', 'content': f'batch {n}', 'parent_id': rng.choice(temp_ids + item_ids),
+                               'temp_id': f't{n}', 'completed': rng.random() < 0.4})
+        elif kind == 'update' and item_ids:
+            operations.append({'op': 'update', 'id': rng.choice(item_ids), 'completed': rng.random() < 0.5})
+        elif kind in ('complete', 'delete') and item_ids:
+            operations.append({'op': kind, 'id': rng.choice(item_ids)})
+        elif kind == 'move' and item_ids:
+            operations.append({'op': 'move', 'id': rng.choice(item_ids), 'new_list_id': rng.choice(list_ids)})
+    return operations
+
+
+def random_write(rng, client, list_ids, item_ids, other_list_ids):
+    """
+    Send one random write request. Some of them are expected to be refused
+    (e.g. moving an item under its own sub-item), which must change nothing.
+    """
+    kind = rng.choice(['add', 'add', 'sub-item', 'update', 'complete', 'move', 'move-under', 'move-away',
+                       'delete', 'delete-list', 'new-list', 'batch', 'batch'])
+    if kind == 'new-list' or not list_ids:
+        return client.post('/todolist', json={'title': 'list'})
+    if kind == 'add' or not item_ids:
+        return client.post('/add-todo-item', json={'content': 'item', 'list_id': rng.choice(list_ids)})
+    if kind == 'sub-item':
+        return client.post('/add-todo-item', json={'content': 'sub-item', 'list_id': None,
+                                                    'parent_id': rng.choice(item_ids)})
+    if kind == 'update':
+        return client.put(f'/update-todo-item/{rng.choice(item_ids)}',
+                          json={'content': 'updated', 'completed': rng.random() < 0.5})
+    if kind == 'complete':
+        return client.put(f'/todoitem/{rng.choice(item_ids)}/complete')
+    if kind == 'move':
+        return client.put(f'/move-item/{rng.choice(item_ids)}', json={'new_list_id': rng.choice(list_ids)})
+    if kind == 'move-under':
+        return client.put(f'/move-item/{rng.choice(item_ids)}',
+                          json={'new_list_id': None, 'new_parent_id': rng.choice(item_ids)})
+    if kind == 'move-away':  # Into another user's list, where the items must disappear from this user's data
+        return client.put(f'/move-item/{rng.choice(item_ids)}', json={'new_list_id': rng.choice(other_list_ids)})
+    if kind == 'delete':
+        return client.delete(f'/delete-todo-item/{rng.choice(item_ids)}')
+    if kind == 'delete-list' and len(list_ids) > 2:
+        return client.delete(f'/delete-todo-list/{rng.choice(list_ids)}')
+    return client.post('/batch', json=random_batch(rng, list_ids, item_ids))
+
+
+def random_writes(seed, steps):
+    """
+    Create a user and a second user with one list, then send the first
+    user's random writes one at a time.
+
+    :return: Yields the step number, the first user's client and both user IDs after every write
+    """
+    rng = random.Random(seed)
+    user_id, other_user_id = create_user(), create_user()
+    client = logged_in_client(user_id)
+    logged_in_client(other_user_id).post('/todolist', json={'title': 'theirs'})
+    other_list_ids, _ = owned_ids(other_user_id)
+
+    for step in range(steps):
+        list_ids, item_ids = owned_ids(user_id)
+        response = random_write(rng, client, list_ids, item_ids, other_list_ids)
+        assert response.status_code < 500, response.get_data(as_text=True)
+        yield step, client, (user_id, other_user_id)
+
+
+def assert_counters_exact(*user_ids):
+    with app.app_context():
+        for user_id in user_ids:
+            assert recount_progress(user_id) == 0